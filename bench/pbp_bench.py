@@ -0,0 +1,131 @@
+import sys
+import os
+import time
+import random
+import subprocess
+import tempfile
+import imp
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+                                '..'))
+import lineupefficiency2 as le2
+
+
+'''
+Benchmark for le2.get_pbp on generated SIDEARM play-by-play pages, full length
+(2 halves) and with overtimes.
+
+python bench/pbp_bench.py [REV]
+
+Given a git revision, that revision's get_pbp is checked against the current
+one on 30 generated games (every HOME/AWAY and M/W) and timed next to it.
+ex: python bench/pbp_bench.py 58443c1^
+'''
+
+#(periods, rows per period) timed for each version
+SIZES = [(2, 220), (3, 230), (4, 120), (6, 130)]
+RUNS = 5 #get_pbp calls averaged for each size
+
+
+'''
+Writes a SIDEARM boxscore page with one play-by-play table per period. About
+a third of the plays change the score; the rest leave the score cell empty the
+way SIDEARM does
+
+Args:
+periods
+rows - plays in each period
+seed - for the random plays
+
+Returns: html string
+'''
+def game(periods, rows, seed):
+    r = random.Random(seed)
+    out = ['<html><body>']
+    home = visitor = 0
+    for period in range(periods):
+        out.append('<table class="sidearm-table play-by-play"><thead><tr>'
+                   '<th scope="col">Time</th></tr></thead><tbody>')
+        for i in range(rows):
+            if r.random() > 0.05:
+                clock = '%02d:%02d' % (19 - i*20//rows, r.randint(0, 59))
+            else:
+                clock = '--'
+            scored = r.random() < 0.3
+            if scored:
+                if r.random() < 0.5:
+                    home = home + r.randint(1, 3)
+                else:
+                    visitor = visitor + r.randint(1, 3)
+                score = '%d-%d' % (visitor, home)
+            else:
+                score = ''
+            team = 'SUB IN  BY SMITH,JOHN' if r.random() < 0.5 else ''
+            opp = '' if team else 'GOOD! JUMPER BY DOE,JANE'
+            out.append('<tr><th scope="row">%s</th>'
+                       '<td class="text-right hide-on-medium-down">%s</td>'
+                       '<td class="hide-on-large text-bold"><span>x</span>%s'
+                       '</td><td style="width:40%%">%s</td>'
+                       '<td style="width:40%%">%s</td></tr>' % \
+                       (clock, team, score, team, opp))
+        out.append('</tbody></table>')
+    out.append('</body></html>')
+    return ''.join(out)
+
+
+'''
+Loads lineupefficiency2.py as it was at a git revision
+
+Returns: the module
+'''
+def load_revision(rev):
+    source = subprocess.check_output(['git', 'show', \
+                                      rev + ':lineupefficiency2.py'])
+    handle, path = tempfile.mkstemp(suffix='.py')
+    with os.fdopen(handle, 'wb') as file:
+        file.write(source)
+    try:
+        return imp.load_source('le2_' + rev.replace('^', '_'), path)
+    finally:
+        for leftover in (path, path + 'c'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+'''
+Average milliseconds for one get_pbp call on soup
+'''
+def time_pbp(module, soup):
+    start = time.time()
+    for i in range(RUNS):
+        module.get_pbp(soup, 'HOME', 'M')
+    return (time.time() - start) / RUNS * 1000
+
+
+def main(rev=None):
+    versions = [('current', le2)]
+    if rev:
+        old = load_revision(rev)
+        versions.insert(0, (rev, old))
+        for seed in range(30):
+            periods = [2, 3, 4, 5, 6][seed % 5]
+            soup = BeautifulSoup(game(periods, 60 + seed*3, seed), \
+                                 'html.parser')
+            for homeaway in ('HOME', 'AWAY'):
+                for mw in ('M', 'W'):
+                    if old.get_pbp(soup, homeaway, mw) != \
+                       le2.get_pbp(soup, homeaway, mw):
+                        print "OUTPUT DIFFERS: seed", seed, homeaway, mw
+                        sys.exit(1)
+        print "outputs match on 30 games"
+    
+    for periods, rows in SIZES:
+        soup = BeautifulSoup(game(periods, rows, 7), 'html.parser')
+        times = ["%s %.1f ms" % (name, time_pbp(module, soup)) \
+                 for name, module in versions]
+        print "%d periods x %d rows:" % (periods, rows), ", ".join(times)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
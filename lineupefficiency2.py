@@ -1,13 +1,39 @@
 import requests #***
-from bs4 import BeautifulSoup #***
-import copy
+from bs4 import BeautifulSoup, SoupStrainer #***
+import collections
 import pandas as pd #for creating dataframe ***
 import numpy as np
 from selenium import webdriver #for getting around website's protections ***
+from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import WebDriverException, TimeoutException
 import itertools #for finding 4/3/2-player lineup combinations
+from multiprocessing.pool import ThreadPool #for concurrent downloads
 import sys #for error handling
 from difflib import SequenceMatcher
 import time
+import Queue #browser pool
+from urlparse import urlparse
+import urllib
+import threading
+import atexit
+import os #on-disk page cache
+import hashlib
+import zlib
+import json
+import csv #name alias tables
+import re
+import tempfile
+import zipfile #record/replay page archives
+import io
+import datetime
+from xml.etree import cElementTree as ElementTree #StatCrew xml feeds
+try:
+    import lxml #faster html parser for boxscore pages, if it's installed
+    FAST_PARSER = 'lxml'
+except ImportError:
+    FAST_PARSER = 'html.parser'
 
 '''
 This program gathers all the lineup data for both teams in a game so we can
@@ -26,32 +52,1200 @@ START_TIME_OT = "05:00"
 POSS_RATIO = 0.44
 GAME_MINUTES = 40
 ONE_PCT = 0.01
+BROWSER_POOL_SIZE = 3 #headless browsers shared by every scraper
+BROWSER_MAX_PAGES = 50 #pages a browser loads before it gets recycled
+READY_TIMEOUT = 15 #seconds a browser waits for a page's tables to show up
+DOWNLOAD_WORKERS = 4 #boxscores downloaded at once by download_all
+HOST_CONNECTIONS = 8 #http requests allowed in flight to one host at a time
+POOL_HOSTS = 20 #hosts the shared http session keeps connection pools for
+FETCH_TIMEOUT = 20 #seconds before a plain http request gives up
+HOST_RATE = 2.0 #requests per second allowed to one host
+HOST_BURST = 4 #requests a host can get back to back before HOST_RATE applies
+FETCH_RETRIES = 3 #retries after a host answers 429 or 5xx
+MAX_SLOWDOWN = 32 #most a host's rate gets divided by after 429s/5xxs
+CACHE_PAGES = True #keep downloaded pages in CACHE_DIR between runs
+CACHE_DIR = '.pagecache'
+SCHEDULE_TTL = 10*60 #seconds a cached schedule page stays fresh
+EVENT_TTL = 60*60 #seconds a cached CBSi interstitial event page stays fresh
+BOXSCORE_TTL = None #finished boxscores don't change, so never expire
+LIVE_BOXSCORE_TTL = 10*60 #seconds a boxscore that isn't final stays fresh
+ARCHIVE_MODE = None #'record' or 'replay' to use team-season page archives
+REFRESH_UNCHANGED = True #rebuild a team's aggregates even with no new games
+FINAL_ONLY = False #leave games that aren't over for later, see not_final
+TEAMNAMES_BATCH = False #queue games with unknown team names instead of asking
+TEAMNAMES_FILE = 'teamnames.csv' #answers about team names, kept across runs
+TEAMNAMES_QUEUE = 'teamnames_queue.csv' #games waiting on an answer
+SIMILAR_TEAM = 0.7 #how similar a name has to be to count as the host team
+
+#a season in a schedule url, ex: 2017-18 or 2017, see archive_season
+SEASON_IN_URL = re.compile(r'(?<!\d)20\d\d(-\d\d(\d\d)?)?(?!\d)')
+
+#what marks a boxscore as final, see page_is_final. Only looked for in the
+#..parts of the page about the game itself, STATUS_REGIONS: score tickers and
+#..nav bars elsewhere say "Final" about other games
+FINAL_PATTERN = re.compile(r'\bFINAL\b(?!\s+FOUR)|\bEND OF GAME\b', \
+                           re.IGNORECASE)
+STATCREW_COMPLETE = re.compile(r'<status\b[^>]*\bcomplete\s*=\s*"Y"', \
+                               re.IGNORECASE)
+
+#where each provider's boxscore says how the game stands, as (tag, attribute,
+#..value) like parse_page's regions: SIDEARM's header, PrestoSports' head and
+#..linescore, CBSi's StatCrew tables
+STATUS_REGIONS = [('figure', 'class', 'box-score-header'),
+                  ('div', 'class', 'box-score-graphic'),
+                  ('div', 'class', 'head'),
+                  ('div', 'class', 'linescore'),
+                  ('center', None, None),
+                  ('pre', None, None)]
+
+#visible text a schedule page needs for a plain http download to be good
+#..enough, see get_page. Same words lineups.scrape picks the provider by
+SCHEDULE_MARKERS = ['SIDEARM', 'CBSI', 'NEULION'] #any one of these
+#..PrestoSports schedules have none of those words, so they're known by the
+#..game rows lineupefficiency3.get_boxscores reads instead (either layout)
+PRESTO_SCHEDULE_SIGNATURES = ['div.event-info.clearfix', 'td.e_links']
+
+#css selectors a page needs before its html gets handed to a parser, see
+#..get_page and wait_until_ready. SIDEARM builds these tables with javascript
+SIDEARM_BOXSCORE_READY = ['table.sidearm-table.play-by-play', \
+                          '#DataTables_Table_0_wrapper']
+
+#parts of a SIDEARM boxscore the scraper reads, as (tag, attribute, value).
+#..Everything else on the page is skipped while parsing, see parse_page
+SIDEARM_BOXSCORE_REGIONS = [('table', 'class', 'sidearm-table'), #pbp, header
+                            ('div', 'id', 'DataTables_Table_0_wrapper'),
+                            ('div', 'id', 'DataTables_Table_1_wrapper'),
+                            ('aside', 'class', 'game-details'),
+                            ('div', 'class', 'game-details-container'),
+                            ('div', 'class', 'box-score-graphic'),
+                            ('figure', 'class', 'box-score-header')]
+
+#hosts the browsers never load anything from, see new_browser
+AD_HOSTS = ['doubleclick.net', 'googlesyndication.com', 'googleadservices.com',
+            'google-analytics.com', 'googletagmanager.com',
+            'googletagservices.com', 'adnxs.com', 'amazon-adsystem.com',
+            'scorecardresearch.com', 'quantserve.com', 'facebook.net',
+            'twitter.com', 'taboola.com', 'outbrain.com', 'moatads.com']
+
+#idle browsers as [browser, pages_loaded]. None marks a free slot that gets a
+#..new browser the next time it's checked out
+_browser_pool = Queue.Queue()
+_browser_pool_lock = threading.Lock()
+_browser_pool_started = False
+
+#keep-alive http session shared by the whole process, see http_session
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+#page archive opened by open_archive for the team-season being scraped
+_archive = None
+_archive_names = set()
+_archive_lock = threading.Lock()
+_replayed = set() #hostnames this process started replaying, see open_archive
+
+#(hostname, markers, ready, signatures) -> 'http' or 'browser', whichever tier
+#..worked, see get_page. Also (hostname, 'statcrew') -> 'xml' or 'html', see
+#..download_games
+_host_tiers = {}
+
+#hostname -> token bucket {'tokens', 'time', 'slowdown', 'until'}, see throttle
+_host_buckets = {}
+_host_buckets_lock = threading.Lock()
+
+#hostname -> semaphore capping requests in flight to that host
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+#the process's umask, so write_file_atomic's files get the usual permissions
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+'''
+Launches one headless Firefox for the browser pool
+
+Images, stylesheets and web fonts are turned off and AD_HOSTS are sent to a
+dead proxy, since the parsers only ever read the html. Page loads are 'eager',
+so get() comes back once the html is parsed and wait_until_ready takes it from
+there
+'''
+def new_browser():
+    options = Options()
+    options.add_argument('-headless')
+    
+    profile = webdriver.FirefoxProfile()
+    profile.set_preference('permissions.default.image', 2)
+    profile.set_preference('permissions.default.stylesheet', 2)
+    profile.set_preference('browser.display.use_document_fonts', 0)
+    profile.set_preference('gfx.downloadable_fonts.enabled', False)
+    profile.set_preference('media.autoplay.default', 5)
+    checks = ' || '.join("dnsDomainIs(host, '%s')" % h for h in AD_HOSTS)
+    pac = "function FindProxyForURL(url, host) { if (%s) " \
+          "return 'PROXY 127.0.0.1:9'; return 'DIRECT'; }" % checks
+    profile.set_preference('network.proxy.type', 2)
+    profile.set_preference('network.proxy.autoconfig_url',
+                           'data:text/plain,' + urllib.quote(pac))
+    
+    capabilities = DesiredCapabilities.FIREFOX.copy()
+    capabilities['pageLoadStrategy'] = 'eager'
+    return webdriver.Firefox(firefox_profile=profile, firefox_options=options,
+                             capabilities=capabilities)
+
+
+'''
+Blocks until every css selector in ready matches something on the browser's
+current page, or the document is done loading if ready is empty
+
+Raises TimeoutException after READY_TIMEOUT seconds
+'''
+def wait_until_ready(browser, ready=None):
+    def loaded(driver):
+        if ready:
+            return all(driver.find_elements_by_css_selector(sel) \
+                       for sel in ready)
+        state = driver.execute_script('return document.readyState')
+        return state in ('interactive', 'complete')
+    WebDriverWait(browser, READY_TIMEOUT, poll_frequency=0.05).until(loaded)
+
+
+'''
+Takes a browser out of the pool, launching one if a slot is free. Blocks until
+one is available when all BROWSER_POOL_SIZE browsers are busy, so it's safe to
+call from several threads at once. Every checkout_browser needs a matching
+checkin_browser.
+
+Returns:
+entry - [browser, pages_loaded]
+'''
+def checkout_browser():
+    global _browser_pool_started
+    with _browser_pool_lock:
+        if not _browser_pool_started:
+            for i in range(BROWSER_POOL_SIZE):
+                _browser_pool.put(None)
+            _browser_pool_started = True
+
+    entry = _browser_pool.get()
+    if entry is None:
+        try:
+            entry = [new_browser(), 0]
+        except:
+            _browser_pool.put(None) #give the slot back
+            raise
+    return entry
+
+
+'''
+Returns a browser to the pool. Browsers that crashed or have loaded
+BROWSER_MAX_PAGES pages are shut down and their slot is freed for a new one.
+
+Args:
+entry - [browser, pages_loaded] from checkout_browser
+crashed - True if the browser threw an error while loading the page
+'''
+def checkin_browser(entry, crashed=False):
+    entry[1] = entry[1] + 1
+    if crashed or entry[1] >= BROWSER_MAX_PAGES:
+        try:
+            entry[0].quit()
+        except:
+            pass
+        _browser_pool.put(None)
+    else:
+        _browser_pool.put(entry)
+
+
+'''
+Shuts down every idle browser in the pool. Registered to run at exit
+'''
+def close_browsers():
+    entries = []
+    while True:
+        try:
+            entries.append(_browser_pool.get_nowait())
+        except Queue.Empty:
+            break
+    for entry in entries:
+        if entry is not None:
+            try:
+                entry[0].quit()
+            except:
+                pass
+        _browser_pool.put(None)
+
+atexit.register(close_browsers)
+
+
+'''
+Loads url in a pooled browser and returns the rendered body html as soon as
+the ready selectors are on the page. Some pages never get them (ex: a
+boxscore with no lineup tables), so after READY_TIMEOUT whatever rendered is
+handed back and the parser decides what to do with it. If the browser
+crashes, times out loading or hands back an empty page, it gets recycled and
+the page is tried once more in a fresh one
+
+Returns:
+html
+complete - False if the page never got its ready selectors
+'''
+def render(url, ready=None):
+    for attempt in range(2):
+        entry = checkout_browser()
+        crashed = False
+        try:
+            throttle(url)
+            entry[0].get(url)
+            try:
+                wait_until_ready(entry[0], ready)
+                complete = True
+            except TimeoutException:
+                print "page never got", ready, "- using what rendered:", url
+                complete = False
+            html = entry[0].execute_script('return document.body.innerHTML')
+            if not html or not html.strip():
+                raise WebDriverException("empty page: " + url)
+            return html, complete
+        except WebDriverException: #TimeoutException is one of these
+            crashed = True
+            if attempt == 1:
+                raise
+        finally:
+            #the browser goes back whatever went wrong, or its slot is lost
+            checkin_browser(entry, crashed)
 
 
 '''
 Use Selenium library to circumvent NCAA website's protection against scraping
 
+Pages are rendered by the shared browser pool instead of launching a new
+Firefox for every url, and the rendered html is kept in the page cache (unless
+it never finished rendering, see render)
+
+Args:
+url
+ready - css selectors the page's parser needs, see wait_until_ready
+regions, parser - what to parse the page with, see parse_page
+
 Returns: a BeautifulSoup object that works on the NCAA site
 '''
-def get_site(url):
-    browser = webdriver.Firefox()
-    browser.get(url)
-    time.sleep(0.2)
-    html = browser.execute_script('return document.body.innerHTML')
-    #html = browser.page_source
-    browser.close()
-    return_soup = BeautifulSoup(html, 'html.parser')
-    if not return_soup:
-        omg = raw_input("THIS RAN! ")
-        browser = webdriver.Firefox()
-        browser.get(url)
-        time.sleep(0.2)
-        html = browser.execute_script('return document.body.innerHTML')
-        browser.close()
-        return_soup = BeautifulSoup(html, 'html.parser')
+def get_site(url, ready=None, regions=None, parser=None):
+    key = 'render:' + url
+    html = archived_page(key)
+    if html is not None:
+        return parse_page(html.decode('utf-8'), regions, parser)
+    
+    entry = cache_entry(key)
+    if entry and cache_is_fresh(entry, cache_ttl(url, entry)):
+        html = cache_read(entry)
+        archive_page(key, html)
+        return parse_page(html.decode('utf-8'), regions, parser)
+    
+    html, complete = render(url, ready)
+    return_soup = parse_page(html, regions, parser)
+    if complete:
+        cache_write(key, html.encode('utf-8'))
+    archive_page(key, html.encode('utf-8'))
     return return_soup
 
 
+'''
+Parses a page into BeautifulSoup. Given regions, only those parts of the page
+get built into the tree (with FAST_PARSER unless another parser is named), so
+nav bars, ads and recaps cost almost nothing. A region is (tag, attribute,
+value) and matches a tag whose attribute contains value, ex: any table with
+'sidearm-table' as one of its classes. An attribute of None matches every tag
+with that name.
+
+Without regions the whole page is parsed with html.parser, same as always
+
+Args:
+html
+regions - list of (tag, attribute, value)
+parser - BeautifulSoup parser to use instead of FAST_PARSER
+
+Returns: BeautifulSoup object
+'''
+def parse_page(html, regions=None, parser=None):
+    if not regions:
+        return BeautifulSoup(html, parser or 'html.parser')
+    
+    def wanted(name, attrs):
+        for tag, attr, value in regions:
+            if tag != name:
+                continue
+            if attr is None:
+                return True
+            found = attrs.get(attr)
+            if isinstance(found, basestring):
+                found = found.split()
+            if found and value in found:
+                return True
+        return False
+    
+    return BeautifulSoup(html, parser or FAST_PARSER, \
+                         parse_only=SoupStrainer(wanted))
+
+
+'''
+Opens the page archive for one team-season, HOSTNAME_SEASON_pages.zip in the
+cwd (next to HOSTNAME_all_lineups.csv). Does nothing unless ARCHIVE_MODE is
+set.
+
+'record' - every schedule and boxscore page fetched gets saved in the archive
+'replay' - every page is read from the archive and nothing touches the
+           network, so a season can be reprocessed after the sites are gone.
+           HOSTNAMEDONE.txt is ignored so every game gets read again (see
+           been_read). Since those games get appended to
+           HOSTNAME_all_lineups.csv, a replay won't start while that file has
+           rows from before it (move or clear it first). Other seasons of
+           the same team replayed later in the run append to it as usual
+
+Args:
+hostname
+sch_url - team's schedule url
+year - season year from todo.txt, or -1 if it didn't have one
+'''
+def open_archive(hostname, sch_url, year=-1):
+    global _archive, _archive_names
+    close_archive()
+    if not ARCHIVE_MODE:
+        return
+    path = hostname.replace(' ', '').lower() + '_' + \
+           archive_season(sch_url, year) + '_pages.zip'
+    if ARCHIVE_MODE == 'replay':
+        if not os.path.exists(path):
+            raise UserWarning("ERROR: no page archive to replay: " + path)
+        lineups = hostname.replace(' ', '').lower() + '_all_lineups.csv'
+        if hostname not in _replayed and os.path.exists(lineups) and \
+           os.path.getsize(lineups) > 0:
+            raise UserWarning("ERROR: replay would count games twice, move or "
+                              "clear " + lineups + " first")
+        _replayed.add(hostname)
+        _archive = zipfile.ZipFile(path, 'r')
+    else:
+        _archive = zipfile.ZipFile(path, 'a', zipfile.ZIP_DEFLATED)
+    _archive_names = set(_archive.namelist())
+
+
+'''
+Helper for open_archive. Names the season a schedule is for: the year from
+todo.txt, else the season in the url (ex: 2017-18), else a short hash of the
+url so two schedules never share an archive
+
+Returns: string that's safe in a filename
+'''
+def archive_season(sch_url, year=-1):
+    if year != -1:
+        return str(year)
+    season = SEASON_IN_URL.search(sch_url)
+    if season:
+        return season.group()
+    return hashlib.sha1(sch_url).hexdigest()[:8]
+
+
+'''
+Closes the open page archive, if any
+'''
+def close_archive():
+    global _archive
+    with _archive_lock:
+        if _archive is not None:
+            _archive.close()
+            _archive = None
+
+atexit.register(close_archive)
+
+
+'''
+In replay mode, returns the archived body for key (raw bytes). Raises
+UserWarning if the page was never recorded, since replay never goes to the
+network, unless required is False (then it's None, ex: archives recorded
+before get_page saved its tiers). Returns None when not replaying
+'''
+def archived_page(key, required=True):
+    if ARCHIVE_MODE != 'replay' or _archive is None:
+        return None
+    name = hashlib.sha1(key).hexdigest()
+    with _archive_lock:
+        if name not in _archive_names:
+            if not required:
+                return None
+            raise UserWarning("ERROR: page not in archive: " + key)
+        return _archive.read(name)
+
+
+'''
+In record mode, saves body (raw bytes) to the archive under key. Members are
+named by the hash of key and carry the key as their comment
+'''
+def archive_page(key, body):
+    if ARCHIVE_MODE != 'record' or _archive is None:
+        return
+    name = hashlib.sha1(key).hexdigest()
+    with _archive_lock:
+        if name in _archive_names:
+            return
+        info = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.comment = key.encode('ascii', 'ignore')
+        _archive.writestr(info, body)
+        _archive_names.add(name)
+
+
+'''
+Tiered fetch: tries a plain http download first and only renders the page in
+a browser if the html is missing something the parser needs. The check is on
+the parsed page, the same visible text and tables the caller reads, so a word
+that only shows up in a script or a link doesn't count. Remembers which tier
+worked for each host, so a host that always needs the browser stops paying for
+the http attempt. The tier each page took is saved in the page archive, so a
+replay takes the same one whatever order the pages come in
+
+Args:
+url
+markers - visible text the page needs to contain (case insensitive)
+require - all (every marker must be there) or any (one is enough)
+ready - css selectors the page needs to have; a rendered page waits for them,
+        see get_site
+regions, parser - what to parse the page with, see parse_page
+signatures - css selectors, any one of which also makes a page good enough
+             without the markers (ex: PRESTO_SCHEDULE_SIGNATURES)
+
+Returns: BeautifulSoup object
+'''
+def get_page(url, markers, require=all, ready=None, regions=None, parser=None,
+             signatures=None):
+    tier_key = (urlparse(url).netloc, tuple(markers), tuple(ready or ()), \
+                tuple(signatures or ()))
+    tier = archived_page('tier:' + url, required=False) or \
+           _host_tiers.get(tier_key)
+    if tier != 'browser':
+        soup = parse_page(fetch_url(url), regions, parser)
+        text = soup.text.upper()
+        if (require(m.upper() in text for m in markers) or \
+            any(soup.select(selector) for selector in signatures or [])) and \
+           all(soup.select(selector) for selector in ready or []):
+            _host_tiers[tier_key] = 'http'
+            archive_page('tier:' + url, 'http')
+            return soup
+        soup.decompose()
+        if tier_key not in _host_tiers:
+            _host_tiers[tier_key] = 'browser'
+        print "plain http page missing", markers or ready, "- using browser"
+    archive_page('tier:' + url, 'browser')
+    return get_site(url, ready, regions, parser)
+
+
+'''
+Gets a SIDEARM boxscore page through get_page, parsing only the
+SIDEARM_BOXSCORE_REGIONS. Used in scrape_all
+'''
+def get_boxscore_page(url):
+    return get_page(url, [], ready=SIDEARM_BOXSCORE_READY,
+                    regions=SIDEARM_BOXSCORE_REGIONS)
+
+
+'''
+StatCrew is the stat software behind PrestoSports and CBSi boxscores, and both
+post the game's raw StatCrew xml (<bbgame>) next to the html page. Reading
+that directly skips the html and the guesswork about which team a play
+belongs to.
+
+Each play in the xml is an action token, ex: action="GOOD" type="JUMPER".
+These get written back out the way the provider's html writes them, so
+update_court, find_missing_players and the stats functions work on them
+unchanged.
+
+(action, type) -> phrase, by arg (1 - PrestoSports, 2 - CBSi). A type of None
+covers every type not listed
+'''
+STATCREW_PHRASES = {
+    1: {('GOOD', 'JUMPER'): "MADE JUMP SHOT",
+        ('GOOD', 'LAYUP'): "MADE LAYUP",
+        ('GOOD', 'DUNK'): "MADE DUNK",
+        ('GOOD', 'TIPIN'): "MADE TIP-IN",
+        ('GOOD', '3PTR'): "MADE 3-PT. JUMP SHOT",
+        ('GOOD', 'FT'): "MADE FREE THROW",
+        ('GOOD', None): "MADE JUMP SHOT",
+        ('MISS', 'JUMPER'): "MISSED JUMP SHOT",
+        ('MISS', 'LAYUP'): "MISSED LAYUP",
+        ('MISS', 'DUNK'): "MISSED DUNK",
+        ('MISS', 'TIPIN'): "MISSED TIP-IN",
+        ('MISS', '3PTR'): "MISSED 3-PT. JUMP SHOT",
+        ('MISS', 'FT'): "MISSED FREE THROW",
+        ('MISS', None): "MISSED JUMP SHOT",
+        ('REBOUND', 'OFF'): "OFFENSIVE REBOUND",
+        ('REBOUND', 'DEF'): "DEFENSIVE REBOUND",
+        ('REBOUND', None): "DEADBALL REBOUND",
+        ('ASSIST', None): "ASSIST",
+        ('TURNOVER', None): "TURNOVER",
+        ('STEAL', None): "STEAL",
+        ('BLOCK', None): "BLOCK",
+        ('FOUL', 'TECH'): "TECHNICAL FOUL",
+        ('FOUL', None): "FOUL",
+        ('SUB', 'IN'): "ENTERS THE GAME",
+        ('SUB', 'OUT'): "GOES TO THE BENCH",
+        ('TIMEOUT', None): "TIMEOUT"},
+    2: {('GOOD', 'JUMPER'): "GOOD! JUMPER",
+        ('GOOD', 'LAYUP'): "GOOD! LAYUP",
+        ('GOOD', 'DUNK'): "GOOD! DUNK",
+        ('GOOD', 'TIPIN'): "GOOD! TIP-IN",
+        ('GOOD', '3PTR'): "GOOD! 3 PTR",
+        ('GOOD', 'FT'): "GOOD! FT SHOT",
+        ('GOOD', None): "GOOD! JUMPER",
+        ('MISS', 'JUMPER'): "MISSED JUMPER",
+        ('MISS', 'LAYUP'): "MISSED LAYUP",
+        ('MISS', 'DUNK'): "MISSED DUNK",
+        ('MISS', 'TIPIN'): "MISSED TIP-IN",
+        ('MISS', '3PTR'): "MISSED 3 PTR",
+        ('MISS', 'FT'): "MISSED FT SHOT",
+        ('MISS', None): "MISSED JUMPER",
+        ('REBOUND', 'OFF'): "REBOUND (OFF)",
+        ('REBOUND', 'DEF'): "REBOUND (DEF)",
+        ('REBOUND', None): "REBOUND (DEF)",
+        ('ASSIST', None): "ASSIST",
+        ('TURNOVER', None): "TURNOVR",
+        ('STEAL', None): "STEAL",
+        ('BLOCK', None): "BLOCK",
+        ('FOUL', None): "FOUL",
+        ('SUB', 'IN'): "SUB IN :",
+        ('SUB', 'OUT'): "SUB OUT:",
+        ('TIMEOUT', None): "TIMEOUT"}
+}
+
+
+'''
+Url of the StatCrew xml a PrestoSports or CBSi boxscore page was made from
+
+ex: .../boxscores/20180201_230l.xml?view=plays#prd2 -> .../20180201_230l.xml
+    .../stats/2017-2018/hou1206.html -> .../stats/2017-2018/hou1206.xml
+'''
+def statcrew_url(url):
+    url = url.split('#')[0].split('?')[0]
+    base, ext = os.path.splitext(url)
+    if ext.lower() in ('.html', '.htm'):
+        return base + '.xml'
+    return url
+
+
+'''
+True if xml is a StatCrew bbgame document, whether or not it's usable
+'''
+def is_statcrew(xml):
+    return '<bbgame' in xml[:4096]
+
+
+'''
+Writes one xml play token out as a play detail line in the provider's style
+
+Args:
+play - attributes of the <play> element
+arg - 1 (PrestoSports) or 2 (CBSi)
+
+Returns: detail string, all caps
+'''
+def statcrew_detail(play, arg):
+    action = play.get('action', '').upper()
+    kind = play.get('type', '').upper()
+    phrases = STATCREW_PHRASES[arg]
+    phrase = phrases.get((action, kind), phrases.get((action, None)))
+    if phrase is None:
+        phrase = (action + ' ' + kind).strip()
+    
+    name = play.get('checkname', '').upper().encode('ascii', 'ignore')
+    if arg == 1:
+        return (name + ' ' + phrase).strip()
+    
+    if name == 'TEAM':
+        name = '(TEAM)'
+    if action == 'REBOUND' and kind == 'DEADB':
+        name = '(DEADBALL)'
+    if action == 'SUB':
+        return phrase + ' ' + name
+    if action == 'TIMEOUT':
+        return phrase
+    return phrase + ' BY ' + name
+
+
+'''
+Reads a StatCrew bbgame xml document in one streaming pass, keeping only what
+the lineup tables need and clearing each element once it's been read
+
+Args:
+xml - the xml document (str)
+arg - 1 (PrestoSports) or 2 (CBSi), see statcrew_detail
+
+Returns: None if the document isn't a usable boxscore (not bbgame, no subs, or
+missing starters), otherwise a dict with
+date - datetime.date the game was played
+prds, minutes, minutesot - periods in regulation and how long periods are
+teams - {'V': AWAY_NAME, 'H': HOME_NAME}
+starters - {'V': [names], 'H': [names]} as written, see statcrew_starters
+plays - list of (period, time, vscore, hscore, vh, detail), scores carried
+        forward from the last scoring play
+'''
+def read_statcrew(xml, arg):
+    if not is_statcrew(xml):
+        return None
+    
+    game = {'date': None, 'prds': 2, 'minutes': 20, 'minutesot': 5,
+            'teams': {}, 'starters': {'V': [], 'H': []}, 'plays': [],
+            'final': page_is_final(xml)}
+    team = None
+    period = 0
+    vscore = '0'
+    hscore = '0'
+    subs = False
+    
+    try:
+        for event, elem in ElementTree.iterparse(io.BytesIO(xml), \
+                                                 ('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                if tag == 'team':
+                    team = elem.get('vh')
+                    game['teams'][team] = elem.get('name', '').upper().\
+                        encode('ascii', 'ignore')
+                elif tag == 'player' and team and elem.get('gs') == '1':
+                    game['starters'][team].append(
+                        (elem.get('checkname') or elem.get('name', '')).\
+                        upper().encode('ascii', 'ignore'))
+                elif tag == 'period':
+                    period = int(elem.get('number', period + 1))
+                continue
+            
+            if tag == 'play':
+                vscore = elem.get('vscore') or vscore
+                hscore = elem.get('hscore') or hscore
+                if elem.get('action', '').upper() == 'SUB':
+                    subs = True
+                game['plays'].append((period, elem.get('time', ''), vscore, \
+                    hscore, elem.get('vh'), statcrew_detail(elem.attrib, arg)))
+                elem.clear()
+            elif tag == 'venue':
+                try:
+                    game['date'] = datetime.datetime.strptime(
+                        elem.get('date', ''), '%m/%d/%Y').date()
+                except ValueError:
+                    pass
+            elif tag == 'rules':
+                for key in ('prds', 'minutes', 'minutesot'):
+                    if elem.get(key, '').isdigit():
+                        game[key] = int(elem.get(key))
+            elif tag == 'team':
+                team = None
+                elem.clear()
+            elif tag == 'period':
+                elem.clear()
+    except ElementTree.ParseError:
+        return None
+    
+    if not subs or len(game['teams']) < 2 or \
+       len(game['starters']['V']) != 5 or len(game['starters']['H']) != 5:
+        return None
+    return game
+
+
+'''
+Returns (AWAY_NAME, HOME_NAME) from a read_statcrew game
+'''
+def statcrew_team_names(game):
+    return [game['teams']['V'], game['teams']['H']]
+
+
+'''
+Returns the homeaway team's starting lineup from a read_statcrew game, run
+through nice_name the same way the html scrapers' get_starters do
+'''
+def statcrew_starters(game, homeaway):
+    return [nice_name(name) for name in \
+            game['starters']['H' if homeaway == "HOME" else 'V']]
+
+
+'''
+Builds the play by play lists for copy_table out of a read_statcrew game, with
+the same START OF PERIOD / END OF PERIOD rows the html scrapers write
+
+Args:
+game - from read_statcrew
+homeaway - "HOME" or "AWAY"
+
+Return: All the data needed as individual lists
+(times, scores, team_details, opp_details)
+'''
+def statcrew_pbp(game, homeaway):
+    side = 'H' if homeaway == "HOME" else 'V'
+    start_time = "%02d:00" % game['minutes']
+    ot_time = "%02d:00" % game['minutesot']
+    
+    times = [start_time]
+    scores = ["0-0"]
+    team_details = ["START OF PERIOD"]
+    opp_details = ["START OF PERIOD"]
+    
+    current_score = "0-0"
+    period = None
+    for prd, clock, vscore, hscore, vh, detail in game['plays']:
+        if period is not None and prd != period:
+            times.append("00:00")
+            times.append(start_time if prd <= game['prds'] else ot_time)
+            scores.append(current_score)
+            scores.append(current_score)
+            team_details.extend(["END OF PERIOD", "START OF PERIOD"])
+            opp_details.extend(["END OF PERIOD", "START OF PERIOD"])
+        period = prd
+        
+        if side == 'H':
+            current_score = hscore + "-" + vscore
+        else:
+            current_score = vscore + "-" + hscore
+        times.append(clock)
+        scores.append(current_score)
+        if vh == side:
+            team_details.append(detail)
+            opp_details.append("")
+        else:
+            team_details.append("")
+            opp_details.append(detail)
+    
+    times.append("00:00")
+    scores.append(current_score)
+    team_details.append("END OF PERIOD")
+    opp_details.append("END OF PERIOD")
+    return times, scores, team_details, opp_details
+
+
+'''
+Downloads a PrestoSports or CBSi game, through its StatCrew xml if the host
+posts one and through the html boxscore page otherwise. Hosts that don't post
+xml only get asked for it once, see download_games. A game whose xml is there
+but can't be used (ex: an exhibition without subs) falls back to its html
+
+Args:
+url - boxscore page url
+arg - 1 (PrestoSports) or 2 (CBSi)
+
+Returns: (game, html) - a read_statcrew game and None, or None and the html
+'''
+def fetch_game(url, arg):
+    if _host_tiers.get((urlparse(url).netloc, 'statcrew')) != 'html':
+        feed, game = fetch_statcrew(url, arg)
+        if game:
+            return game, None
+    return None, fetch_url(url)
+
+
+'''
+Helper for fetch_game. Downloads and reads the StatCrew xml next to a
+boxscore page
+
+Returns: (feed, game)
+feed - True if the host posted a StatCrew document for the game, False if it
+       didn't (ex: a 404 page), None if the download failed
+game - a read_statcrew game, or None if there's no usable xml
+'''
+def fetch_statcrew(url, arg):
+    try:
+        xml = fetch_url(statcrew_url(url))
+    except (requests.RequestException, UserWarning): #UserWarning: not archived
+        return None, None
+    if not is_statcrew(xml):
+        return False, None
+    return True, read_statcrew(xml, arg)
+
+
+'''
+download_all for PrestoSports and CBSi games, see fetch_game. Before anything
+gets downloaded in parallel, each new host's games are tried for xml in order
+until one settles whether that host posts StatCrew documents at all, so every
+game after it takes the same path no matter how the downloads are timed. Only
+a missing document settles a host on html; one game with unusable xml doesn't
+
+Args:
+links - boxscore page urls
+arg - 1 (PrestoSports) or 2 (CBSi)
+
+Returns: generator of (game, html) for each link, in order
+'''
+def download_games(links, arg):
+    settled = {}
+    for link in links or []:
+        tier_key = (urlparse(link).netloc, 'statcrew')
+        if tier_key not in _host_tiers:
+            feed, settled[link] = fetch_statcrew(link, arg)
+            if feed is not None:
+                _host_tiers[tier_key] = 'xml' if feed else 'html'
+    
+    def fetch(link):
+        if settled.get(link):
+            return settled[link], None
+        if link in settled:
+            return None, fetch_url(link) #xml already tried
+        return fetch_game(link, arg)
+    return download_all(links, fetch)
+
+
+'''
+How long a cached copy of url stays fresh, by kind of page. A boxscore is kept
+forever once it was final when it got cached, but a game still being played
+(or one the host hasn't finished posting) is only kept for a few minutes, same
+as schedules, which change as games get played.
+
+Args:
+url
+entry - the url's cache entry, see cache_entry
+
+Returns: seconds, or None for never expires
+'''
+def cache_ttl(url, entry=None):
+    lower = url.lower()
+    if 'grfx.cstv.com' in lower:
+        return EVENT_TTL
+    elif is_boxscore_url(lower):
+        if entry and entry.get('final'):
+            return BOXSCORE_TTL
+        return LIVE_BOXSCORE_TTL
+    else:
+        return SCHEDULE_TTL
+
+
+'''
+True for a url (or cache key) of a boxscore page or its xml
+'''
+def is_boxscore_url(url):
+    lower = url.lower()
+    return 'boxscore' in lower or '/stats/' in lower
+
+
+'''
+True if a boxscore says its game is over: a StatCrew xml status marked
+complete, or a final score or end of game marker in the page's STATUS_REGIONS
+
+Args:
+body - raw page content
+'''
+def page_is_final(body):
+    if is_statcrew(body):
+        return STATCREW_COMPLETE.search(body) is not None
+    soup = parse_page(body, STATUS_REGIONS)
+    final = status_is_final(soup)
+    soup.decompose()
+    return final
+
+
+'''
+page_is_final for a page that's already parsed, as long as its regions take
+in the STATUS_REGIONS the provider uses
+'''
+def status_is_final(soup):
+    for tag, attr, value in STATUS_REGIONS:
+        for region in soup.find_all(tag, {attr: value} if attr else {}):
+            if FINAL_PATTERN.search(region.text):
+                return True
+    return False
+
+
+'''
+With FINAL_ONLY set (watch mode), True for a game that isn't over yet. The
+scrapers skip it without adding it to HOSTNAMEDONE.txt, so it gets scraped on
+a later poll once it's final
+
+Args:
+final - page_is_final of the game's page, or a StatCrew game's 'final'
+link - the game's url, for the message
+'''
+def not_final(final, link):
+    if FINAL_ONLY and not final:
+        print "game isn't final yet, leaving it for later:", link, "\n"
+        return True
+    return False
+
+
+'''
+Helper for the page cache. Paths of the index file for a key and of the
+compressed file for a body. Bodies are stored by the hash of their content, so
+identical pages are only stored once
+'''
+def cache_index_path(key):
+    return os.path.join(CACHE_DIR, 'index', hashlib.sha1(key).hexdigest())
+
+def cache_body_path(digest):
+    return os.path.join(CACHE_DIR, 'bodies', digest + '.z')
+
+
+'''
+Looks up a key (usually a url) in the page cache
+
+Returns:
+entry - dict with the body's hash, when it was fetched and the ETag and
+        Last-Modified headers the host sent with it
+None - if the key isn't cached
+'''
+def cache_entry(key):
+    if not CACHE_PAGES:
+        return None
+    try:
+        with open(cache_index_path(key), 'rb') as file:
+            return json.load(file)
+    except (IOError, ValueError):
+        return None
+
+
+'''
+True if a cache entry is younger than ttl seconds (ttl None means forever)
+'''
+def cache_is_fresh(entry, ttl):
+    if ttl is None:
+        return True
+    return time.time() - entry['fetched'] < ttl
+
+
+'''
+Returns the decompressed body of a cache entry
+'''
+def cache_read(entry):
+    with open(cache_body_path(entry['body']), 'rb') as file:
+        return zlib.decompress(file.read())
+
+
+'''
+Stores a page in the cache. Files are written to a temp file and renamed into
+place so other threads and processes never read half a file.
+
+Args:
+key - usually the url
+body - raw page content as a byte string
+etag, last_modified - validators from the response headers, if any
+'''
+def cache_write(key, body, etag=None, last_modified=None):
+    if not CACHE_PAGES:
+        return
+    digest = hashlib.sha1(body).hexdigest()
+    body_path = cache_body_path(digest)
+    if not os.path.exists(body_path):
+        write_file_atomic(body_path, zlib.compress(body))
+    entry = {'key': key, 'body': digest, 'fetched': time.time(),
+             'etag': etag, 'last_modified': last_modified,
+             'final': is_boxscore_url(key) and page_is_final(body)}
+    write_file_atomic(cache_index_path(key), json.dumps(entry))
+
+
+'''
+Atomically writes data to path: writes a temp file next to it and renames it
+into place, so nobody ever sees half a file. Used for the page cache and the
+TEAMn.csv outputs
+'''
+def write_file_atomic(path, data):
+    folder = os.path.dirname(path)
+    try:
+        os.makedirs(folder)
+    except OSError:
+        pass #already exists
+    handle, temp = tempfile.mkstemp(dir=folder)
+    with os.fdopen(handle, 'wb') as file:
+        file.write(data)
+    os.chmod(temp, 0666 & ~_umask) #mkstemp makes it private to us
+    os.rename(temp, path)
+
+
+'''
+Per-host rate limiter used before every page load, plain http or browser.
+Each host has a token bucket that refills at HOST_RATE requests per second
+(divided by the host's slowdown) and holds up to HOST_BURST. A request takes
+a token, and if the bucket is empty it sleeps until its token comes in. The
+bucket can go negative, so threads waiting on the same host line up instead
+of all waking at once
+'''
+def throttle(url):
+    host = urlparse(url).netloc
+    with _host_buckets_lock:
+        now = time.time()
+        bucket = _host_buckets.get(host)
+        if bucket is None:
+            bucket = {'tokens': HOST_BURST, 'time': now, 'slowdown': 1.0, \
+                      'until': 0}
+            _host_buckets[host] = bucket
+        rate = HOST_RATE / bucket['slowdown']
+        bucket['tokens'] = min(HOST_BURST, \
+                               bucket['tokens'] + (now-bucket['time'])*rate)
+        bucket['time'] = now
+        bucket['tokens'] = bucket['tokens'] - 1
+        wait = max(-bucket['tokens'] / rate, bucket['until'] - now, 0)
+        _host_buckets[host] = bucket #a shared dict hands out copies
+    if wait > 0:
+        time.sleep(wait)
+
+
+'''
+Makes throttle, slow_down and speed_up use token buckets shared with other
+processes, so teams scraped at once by lineups.run_parallel stay under
+HOST_RATE together on hosts they have in common (ex: grfx.cstv.com). Used as
+the worker pool's initializer
+
+Args:
+buckets - dict from a multiprocessing.Manager
+lock - lock from the same Manager
+'''
+def share_throttle(buckets, lock):
+    global _host_buckets, _host_buckets_lock
+    _host_buckets = buckets
+    _host_buckets_lock = lock
+
+
+'''
+Adaptive backoff for a host that answered 429 or 5xx: halves its rate (down
+to HOST_RATE/MAX_SLOWDOWN) and holds every request to it for delay seconds
+
+Args:
+url
+delay - seconds, from the Retry-After header if the host sent one
+'''
+def slow_down(url, delay):
+    host = urlparse(url).netloc
+    with _host_buckets_lock:
+        bucket = _host_buckets.get(host)
+        if bucket is not None:
+            bucket['slowdown'] = min(bucket['slowdown'] * 2, MAX_SLOWDOWN)
+            bucket['until'] = max(bucket['until'], time.time() + delay)
+            _host_buckets[host] = bucket
+    print "host is throttling us, backing off", delay, "seconds:", host
+
+
+'''
+After a good response, lets a host that was slowed down speed back up
+'''
+def speed_up(url):
+    host = urlparse(url).netloc
+    with _host_buckets_lock:
+        bucket = _host_buckets.get(host)
+        if bucket is not None and bucket['slowdown'] > 1:
+            bucket['slowdown'] = max(bucket['slowdown'] / 2, 1.0)
+            _host_buckets[host] = bucket
+
+
+'''
+Returns the semaphore that caps how many requests can be in flight to url's
+host at once (HOST_CONNECTIONS)
+'''
+def host_slot(url):
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(HOST_CONNECTIONS)
+        return _host_slots[host]
+
+
+'''
+Returns the process-wide keep-alive http session. It keeps a pool of up to
+HOST_CONNECTIONS open connections for each of POOL_HOSTS hosts, so requests
+to the same athletics site reuse connections instead of paying for a new TCP
+and TLS handshake every time. A new session is made after a fork so worker
+processes never share sockets
+'''
+def http_session():
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=POOL_HOSTS, pool_maxsize=HOST_CONNECTIONS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+'''
+Downloads a page with a plain http request, no browser. Safe to call from
+several threads; at most HOST_CONNECTIONS requests go to the same host at once.
+All of le2/le3/le5's plain http downloads go through here and share one
+keep-alive session
+
+Fresh pages come straight out of the page cache. Stale ones are revalidated
+with the ETag/Last-Modified the host sent last time, so an unchanged page costs
+a 304 instead of a full download. Pages also go through the team-season
+archive when ARCHIVE_MODE is set (see open_archive)
+
+Returns: raw page content
+'''
+def fetch_url(url):
+    content = archived_page(url)
+    if content is not None:
+        return content
+    content = fetch_url_cached(url)
+    archive_page(url, content)
+    return content
+
+
+'''
+Helper for fetch_url. Does the download through the page cache
+'''
+def fetch_url_cached(url):
+    entry = cache_entry(url)
+    if entry and cache_is_fresh(entry, cache_ttl(url, entry)):
+        return cache_read(entry)
+    
+    headers = {}
+    if entry:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+    
+    for attempt in range(FETCH_RETRIES + 1):
+        throttle(url)
+        with host_slot(url):
+            r = http_session().get(url, headers=headers, timeout=FETCH_TIMEOUT)
+        if r.status_code != 429 and r.status_code < 500:
+            speed_up(url)
+            break
+        if attempt < FETCH_RETRIES:
+            try:
+                delay = int(r.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                delay = 2 ** attempt
+            slow_down(url, delay)
+    
+    if r.status_code == 304 and entry:
+        content = cache_read(entry)
+        cache_write(url, content, entry['etag'], entry['last_modified'])
+        return content
+    if r.status_code == 200:
+        cache_write(url, r.content, r.headers.get('ETag'), \
+                    r.headers.get('Last-Modified'))
+    return r.content
+
+
+'''
+Downloads every link with up to DOWNLOAD_WORKERS downloads running at once and
+hands back the pages in the same order as links. The whole list starts
+downloading right away, but the caller still parses games one at a time in
+schedule order, so output doesn't change. If a download fails, the error is
+raised when the caller reaches that game.
+
+Args:
+links - list of urls
+fetch - function that downloads one url (ex: get_site, fetch_url)
+workers - max downloads at once (default DOWNLOAD_WORKERS)
+
+Returns: generator of fetch(link) for each link, in order
+'''
+def download_all(links, fetch, workers=None):
+    if not links:
+        return
+    if workers is None:
+        workers = DOWNLOAD_WORKERS
+    pool = ThreadPool(min(workers, len(links)))
+    try:
+        jobs = [pool.apply_async(fetch, (link,)) for link in links]
+        for job in jobs:
+            yield job.get()
+    finally:
+        pool.terminate()
+
 
 '''
 Takes one game's boxscore page and scrapes "raw" play by play table
@@ -75,69 +1269,74 @@ def get_pbp(soup, homeaway, mw):
     table_soup = soup.findAll("table", {"class":"sidearm-table play-by-play"})
     
     end_of_period_locs = []
-    index = 0
     
     times = []   
     scores = []
     details_team = []
     details_opp = []
-        
+    
     #as you loop through tables for each period, add game data AND rows for
-    #... start and end of period
+    #... start and end of period. Each period's table is walked once, cell by
+    #... cell, and every cell goes to whichever lists it belongs to
     periods_played = 0
-    index = 0
-    for n, row in enumerate(table_soup):
+    index = 0 #rows in times, not counting end of period rows
+    current_score = "0-0" #last score seen, fills in rows without one
+    for table in table_soup:
         #add start of period info
         if periods_played <= OTcheck: times.append(start_time)
         else: times.append(START_TIME_OT)
         if periods_played == 0: scores.append("0-0")
         else: scores.append(scores[index-1])
+        current_score = scores[-1]
         details_team.append("START OF PERIOD")
         details_opp.append("START OF PERIOD")
         index = index+1
-
-        #TIMES
-        current_time = start_time
-        for t in table_soup[n].findAll("th", {"scope":"row"}):
-            index = index+1
-            if ':' not in t.contents[0]: #if the data isn't a valid time
-                times.append(current_time)
-            else:
-                current_time = t.contents[0]
-                times.append(current_time)
         
-        #SCORES
-        for s in table_soup[n].findAll("td", {"class":"hide-on-large text-bold"}):
-            try:
-                if homeaway == "AWAY":
-                    scores.append(str(s.contents[1]).strip())
-                elif homeaway == "HOME":
-                    scores.append(flip(str(s.contents[1]).strip()))
-                else:
-                    print "ERROR with homeaway argument. Likely doesn't equal" \
-                          + " 'HOME' or 'AWAY'"
-                    break
-            except:
-                scores.append("")
-    
-        current_score = "0-0"
-        for num, item in enumerate(scores):
-            if "PERIOD" not in item:
-                if item: #if nonempty
-                    current_score = item
-                else:
-                    scores[num] = current_score
-                
-        #TEAM AND OPPONENT GAME DETAILS
-        for t in table_soup[n].findAll("td", \
-                                {"class":"text-right hide-on-medium-down"}):
-            try: details_team.append(t.contents[0].replace("  ", " ").upper())
-            except: details_team.append("")
-        for num, o in enumerate(table_soup[n].findAll("td", \
-                                                      {"style":"width:40%"})):
-            if num%2==1:
-                try: details_opp.append(o.contents[0].replace("  ", " ").upper())
-                except: details_opp.append("")
+        current_time = start_time
+        read_scores = True
+        opp_cells = 0
+        for cell in table.find_all(['th', 'td']):
+            classes = ' '.join(cell.get('class', []))
+            
+            #TIMES
+            if cell.name == 'th':
+                if cell.get('scope') == 'row':
+                    index = index+1
+                    if ':' in cell.contents[0]: #if the data is a valid time
+                        current_time = cell.contents[0]
+                    times.append(current_time)
+                continue
+            
+            #SCORES
+            if classes == "hide-on-large text-bold" and read_scores:
+                try:
+                    if homeaway == "AWAY":
+                        score = str(cell.contents[1]).strip()
+                    elif homeaway == "HOME":
+                        score = flip(str(cell.contents[1]).strip())
+                    else:
+                        print "ERROR with homeaway argument. Likely doesn't "\
+                              "equal 'HOME' or 'AWAY'"
+                        read_scores = False
+                        score = None
+                except:
+                    score = ""
+                if score: #if nonempty
+                    current_score = score
+                if score is not None:
+                    scores.append(current_score)
+            
+            #TEAM AND OPPONENT GAME DETAILS
+            if classes == "text-right hide-on-medium-down":
+                try: details_team.append(cell.contents[0].replace("  ", " ").\
+                                         upper())
+                except: details_team.append("")
+            if cell.get('style') == "width:40%":
+                if opp_cells%2==1:
+                    try: details_opp.append(cell.contents[0].\
+                                            replace("  ", " ").upper())
+                    except: details_opp.append("")
+                opp_cells = opp_cells+1
         
         #add end of period info
         times.append("00:00")
@@ -155,6 +1354,158 @@ def get_pbp(soup, homeaway, mw):
     return times, scores, details_team, details_opp, end_of_period_locs
 
 
+#attribute behind each index of a PlayRow, so row[4] still means the lineup
+ROW_FIELDS = ('time', 'score', 'team', 'opp', 'lineup')
+
+#lineup of a row in the middle of a substitution
+MIDSUB = -1
+
+#name -> bit, bit -> name for every player seen this team-season. Lineups are
+#..ints with one bit set per player on the court, see player_bit
+_player_bits = {}
+_player_names = []
+
+
+'''
+Forgets the roster. Called when a new team-season starts
+'''
+def reset_roster():
+    global _player_bits, _player_names
+    _player_bits = {}
+    _player_names = []
+
+
+'''
+Returns the bit that stands for name in a lineup, giving the name the next
+free one the first time it's seen
+'''
+def player_bit(name):
+    bit = _player_bits.get(name)
+    if bit is None:
+        bit = 1 << len(_player_names)
+        _player_bits[name] = bit
+        _player_names.append(name)
+    return bit
+
+
+'''
+Lineup (int) with every player in names on the court
+'''
+def lineup_mask(names):
+    lineup = 0
+    for name in names:
+        lineup |= player_bit(name)
+    return lineup
+
+
+'''
+Number of players in a lineup
+'''
+def lineup_size(lineup):
+    return bin(lineup).count('1')
+
+
+'''
+Names of the players in a lineup, sorted like the lineup lists always were
+'''
+def lineup_names(lineup):
+    if lineup == MIDSUB:
+        return ["SUBSTITUTION IN PROGRESS"]
+    names = []
+    n = 0
+    while lineup:
+        if lineup & 1:
+            names.append(_player_names[n])
+        lineup >>= 1
+        n = n+1
+    return sorted(names)
+
+
+'''
+Stable 63-bit key for a lineup given as its player columns, so dataframe can
+group on one integer instead of five name columns. Keeps its value across
+runs and processes, unlike hash()
+'''
+def lineup_key(names):
+    digest = hashlib.md5('\n'.join(names)).hexdigest()
+    return int(digest[:16], 16) >> 1
+
+
+'''
+One row of the play table built by copy_table. The strings are kept as they
+were scraped (they end up in the csv as is) and everything lineup_table and
+the fix-up passes keep asking of them is worked out once here:
+
+clock - seconds left in the period, from time
+margin - team score minus opponent score, from score
+team_play, opp_play - classify() of the team and opponent details
+lineup - the team's players on the court as an int, see player_bit, or MIDSUB
+
+clock and margin are None if the strings don't parse, and the places that use
+them go back to time_convert/plus_minus so a bad row fails the same way it
+always did. Indexing with 0-4 reads and writes time, score, team, opp and
+lineup like the nested lists copy_table used to return.
+'''
+class PlayRow(object):
+    __slots__ = ('time', 'score', 'team', 'opp', 'lineup', 'clock', 'margin', \
+                 'team_play', 'opp_play')
+    
+    def __init__(self, time, score, team, opp, lineup, arg):
+        self.time = time
+        self.score = score
+        self.team = team
+        self.opp = opp
+        self.lineup = lineup
+        try:
+            self.clock = time_convert(time)
+        except ValueError:
+            self.clock = None
+        try:
+            self.margin = plus_minus(score)
+        except (ValueError, IndexError):
+            self.margin = None
+        self.team_play = classify(team, arg)
+        self.opp_play = classify(opp, arg)
+    
+    def __getitem__(self, index):
+        return getattr(self, ROW_FIELDS[index])
+    
+    def __setitem__(self, index, value):
+        setattr(self, ROW_FIELDS[index], value)
+    
+    '''
+    Play for column 2 (team) or 3 (opponent)
+    '''
+    def play(self, col):
+        if col == 2:
+            return self.team_play
+        return self.opp_play
+    
+    def copy(self):
+        row = PlayRow.__new__(PlayRow)
+        for field in PlayRow.__slots__:
+            setattr(row, field, getattr(self, field))
+        return row
+
+
+'''
+Seconds left on a row's clock
+'''
+def row_clock(row):
+    if row.clock is None:
+        return time_convert(row.time)
+    return row.clock
+
+
+'''
+Team score minus opponent score on a row
+'''
+def row_margin(row):
+    if row.margin is None:
+        return plus_minus(row.score)
+    return row.margin
+
+
 '''
 Given all the data collected in get_pbp, create a nice formatted table
 
@@ -170,14 +1521,14 @@ arg - integer - lets us run this function on multiple html styles
     2 - CBSi
 
 Return:
-table - a nested list; format:
-      - [TIME, SCORE, TEAM_DETAIL, OPP_DETAIL, TEAM_LINEUP, OPP_LINEUP]
+table - list of PlayRow, which still index like the old nested lists:
+      - [TIME, SCORE, TEAM_DETAIL, OPP_DETAIL, TEAM_LINEUP]
 '''
 def copy_table(cols, starters, arg):        
     table = []
     periods_played = 0 #used to run update_court
     
-    court = sorted(starters)
+    court = lineup_mask(starters)
 
     #ADD DATA
     for index in range(len(cols[0])):
@@ -187,22 +1538,21 @@ def copy_table(cols, starters, arg):
             court_holder = update_court(court, cols[2], index, arg)
         else:
             court_holder = (court, False)
-        court = sorted(court_holder[0])
+        court = court_holder[0]
         midsub = court_holder[1]
                 
-        temp = []
-        temp.append(cols[0][index].encode('ascii', 'ignore')) #times
-        temp.append(cols[1][index].encode('ascii', 'ignore')) #scores
-        #team details
-        temp.append(cols[2][index].encode('ascii', 'ignore').replace(',', '.'))
-        #opponent details
-        temp.append(cols[3][index].encode('ascii', 'ignore').replace(',', '.'))
         if midsub:
-            temp.append(["SUBSTITUTION IN PROGRESS"])
+            lineup = MIDSUB
         else:
-            temp.append(court) #lineup
-
-        table.append(temp)
+            lineup = court
+        
+        table.append(PlayRow(cols[0][index].encode('ascii', 'ignore'), \
+                             cols[1][index].encode('ascii', 'ignore'), \
+                             cols[2][index].encode('ascii', 'ignore').\
+                                 replace(',', '.'), \
+                             cols[3][index].encode('ascii', 'ignore').\
+                                 replace(',', '.'), \
+                             lineup, arg))
     
     #for i in range(len(table)):
         #print table[i][0], table[i][4]
@@ -211,15 +1561,14 @@ def copy_table(cols, starters, arg):
     #RUN FIND_MISSING_PLAYERS TO FILL IN GAPS IN PLAY DATA
     end_locs = []
     for num, row in enumerate(cols[2]):
-        if "END OF" in row:
+        if classify(row, arg).period == 'END':
             end_locs.append(num)
     for index, loc in enumerate(end_locs[:len(end_locs)-1]):
         start = end_locs[index]+1
         end = end_locs[index+1]+1
         segment = table[start : end]
         #print start, end
-        mod_table = find_missing_players(segment, 0, arg)
-        table = table[:start] + mod_table + table[end:]
+        table[start : end] = find_missing_players(segment, 0, arg)
     
     #df = pd.DataFrame(data=table)
     #df.to_csv('test_copytable.csv') 
@@ -232,7 +1581,7 @@ Helper to update the list of who is on the court and keep track of subs. Used
 in copy_table()
 
 Args:
-court - list of players on court
+court - lineup (int) of players on court, see player_bit
 col - specified list in cols (the argument of copy_table), will either
       correspond to column of team details, or opponent details
 index - iteration of loop in copy_table
@@ -243,73 +1592,38 @@ arg - integer - lets us run this function on multiple html styles
 
 Return:
 (new, midsub)
-new - new list of players on court
+new - new lineup of players on court
 midsub - tracks whether we are in the middle of a substitution. responsible for
          lines that read 'subbing in progress'
 '''
 def update_court(court, col, index, arg):
-    if arg == 0:
-        tagin = "SUB IN"
-        tagin_replace = "SUB IN BY "
-        tagout = "SUB OUT"
-        tagout_replace = "SUB OUT BY "
-        tag1 = "SUB"
-        tag2 = "SUB"
-    elif arg == 1:
-        tagin = "ENTERS THE GAME"
-        tagin_replace = "ENTERS THE GAME"
-        tagout = "GOES TO THE BENCH"
-        tagout_replace = "GOES TO THE BENCH"
-        tag1 = "ENTERS THE"
-        tag2 = "TO THE BENCH"
-    elif arg == 2:
-        tagin = "SUB IN"
-        tagin_replace = "SUB IN : "
-        tagout = "SUB OUT"
-        tagout_replace = "SUB OUT: "
-        tag1 = "SUB"
-        tag2 = "SUB"
-    
     midsub = False #tells you when sub in line is read without sub out line
-    copy = court[:]
+    play = classify(col[index], arg)
     
     #it's not possible for lineup changes to be made exactly at end of period
-    if "END OF" in col[index]:
-        return copy, midsub
+    if play.period == 'END':
+        return court, midsub
     
     #if it's a new period, start with a blank slate. this method is not called
     #..on the original run through when starters are known already
-    elif "START OF" in col[index]:
-        return [], midsub
+    elif play.period == 'START':
+        return 0, midsub
     
-    elif tagin in col[index]:
-        name = col[index].replace(tagin_replace, "")
-        name = nice_name(name)
-        
-        if name not in copy:
-            copy.append(name)
-
-        if tag1 in col[index+1] or tag2 in col[index+1]:
+    elif play.sub == 'IN':
+        if classify(col[index+1], arg).near_sub:
             midsub = True
         
-        return copy, midsub
+        return court | player_bit(play.sub_player), midsub
     
-    elif tagout in col[index]:
-        name = col[index].replace(tagout_replace, "")
-        name = nice_name(name)
-        
-        if tag1 in col[index+1] or tag2 in col[index+1]:
+    elif play.sub == 'OUT':
+        if classify(col[index+1], arg).near_sub:
             midsub = True
         
-        try:
-            copy.remove(name)
-            return copy, midsub
-        except:
-            #print "SPECIAL CASE"
-            return copy, midsub
+        #a player who was never on the court just doesn't change anything
+        return court & ~player_bit(play.sub_player), midsub
     
     else:
-        return copy, midsub
+        return court, midsub
         
 
 '''
@@ -322,6 +1636,7 @@ homeaway
 Returns:
 starters - list of length 5 with each player in the starting lineup
 None - if exhibition game
+[] - if the page has no lineup tables (it never finished rendering)
 '''
 def get_starters(soup, homeaway):
     game_info = soup.find('aside', {'class':'game-details'}).text.upper()
@@ -341,7 +1656,10 @@ def get_starters(soup, homeaway):
     else:
         table = soup.find('div', {'id':'DataTables_Table_1_wrapper'})
     
-    if not table: print table #111 - why is it always crashing?!
+    if not table:
+        #never rendered (see render), so there's nothing to read yet
+        print "no lineup table on the page. returning []."
+        return starters
     
     rows = table.find_all('th', {'scope':'row'})
     for row in rows[:5]:
@@ -403,66 +1721,54 @@ arg - integer - lets us run this function on multiple html styles
     2 - CBSi
 
 Returns:
-tcopy - modified deep copy of inputted table
+tcopy - modified copy of inputted table
 '''
 def find_missing_players(table, teamopp, arg):
-    if arg == 0:
-        tagout = "SUB OUT"
-        tagout_replace = "SUB OUT BY "
-    elif arg == 1:
-        tagout = "GOES TO THE BENCH"
-        tagout_replace = "GOES TO THE BENCH"
-    elif arg == 2:
-        tagout = "SUB OUT"
-        tagout_replace = "SUB OUT: "    
-    
     if teamopp == 0: mark = 2
     elif teamopp == 1: mark = 3
     
-    tcopy = copy.deepcopy(table)
-    flag = True #True if player subbed in needs to be added to rows
+    tcopy = [row.copy() for row in table]
     
     '''
-    If a player is mentioned coming out, add that player to the lineup list
-    for all the rows above. We're only looking for players who started the
+    If a player is mentioned coming out, add that player to the lineup for
+    all the rows above. We're only looking for players who started the
     period, and the table as is has data for every nonstarter. So if the player
-    was already listed in any of the lineup lists, they didn't start, so stop
-    trying to add them
+    was already in any of the lineups above, they didn't start, so leave them
+    be. seen is everyone in the lineups above the current row, including the
+    players added to them so far, and added[n] is who gets added to every row
+    above row n
     '''
+    seen = 0
+    lineup_above = False #True once there's a lineup above to add players to
+    added = [0] * len(tcopy)
     for n, row in enumerate(tcopy):
-        if tagout in row[mark]:
-            name = row[mark].replace(tagout_replace, "")
-            name = nice_name(name)
-            
-            for x in reversed(tcopy[:n]):
-                #print x[0], x[4]
-                if name in x[mark+2]:
-                    flag = False
-                    break
-            
-            #print name, flag, "\n"
-            
-            if flag:
-                for num, x in enumerate(tcopy[:n]):
-                    if "SUBSTITUTION IN PROGRESS" not in tcopy[num][mark+2]:
-                        tcopy[num][mark+2].append(name)
-                        tcopy[num][mark+2] = sorted(tcopy[num][mark+2])
-                            
-            flag = True
+        play = row.play(mark)
+        if play.sub == 'OUT':
+            bit = player_bit(play.sub_player)
+            if not seen & bit:
+                added[n] = bit
+                if lineup_above:
+                    seen |= bit
+        
+        if row.lineup != MIDSUB:
+            seen |= row.lineup
+            lineup_above = True
             
     '''
     And if a player never subs out, look for details that involve them anywhere
     in the half and that's our missing starter(s), because everyone else will
     have been accounted for
     '''
-    missing = find_super_missing_players(tcopy, teamopp, arg)
+    missing = find_super_missing_players(tcopy, teamopp, arg, seen)
     #if missing:
         #print len(missing), "missing players via find_super_missing_players:", missing
-    for num, x in enumerate(tcopy):
-        for player in missing:
-            if "SUBSTITUTION IN PROGRESS" not in tcopy[num][mark+2]:
-                tcopy[num][mark+2].append(player)
-                tcopy[num][mark+2] = sorted(tcopy[num][mark+2])
+    
+    #one pass from the bottom up puts both on every row
+    offset = lineup_mask(missing)
+    for n in range(len(tcopy)-1, -1, -1):
+        if tcopy[n].lineup != MIDSUB:
+            tcopy[n].lineup |= offset
+        offset |= added[n]
     
     #for i in range(len(tcopy)):
         #print tcopy[i][0], tcopy[i][4]
@@ -483,68 +1789,108 @@ arg - integer - lets us run this function on multiple html styles
     1 - PrestoSports
     2 - CBSi
 
+found - everyone already in a lineup in table, if the caller knows
+
 Return:
 missing - list of players that never subbed out of the period
 '''
-def find_super_missing_players(table, teamopp, arg):
+def find_super_missing_players(table, teamopp, arg, found=None):
     if teamopp == 0: mark = 2
     elif teamopp == 1: mark = 3
     
-    found = []
-    for row in table:
-        for player in row[mark+2]:
-            if player not in found:
-                found.append(player)
+    if found is None:
+        found = 0
+        for row in table:
+            if row.lineup != MIDSUB:
+                found |= row.lineup
 
     missing = []
     
     for row in table:
-        if " BY " in row[mark] and arg != 1:
-            if arg == 0:
-                name = row[mark][row[mark].find("BY ")+3:].\
-                    replace("(FASTBREAK)", "").replace("(IN THE PAINT)", "")
-                
-            if arg == 2:
-                name = row[mark]
-                if "BY " in name:
-                    name = name[name.find("BY ")+3:].replace('[FB/PNT]', '').\
-                        replace('[PNT]', '').replace('[FB]', '').\
-                        replace('THE BENCH', '')
-                else:
-                    name = name[name.find(": ")+2:].replace('SUB IN : ', '').\
-                           replace('SUB OUT:', '')
-                name = remove_foul_details(name)
-                
-            name = nice_name(name) 
-            
-            if name not in found and name != "TEAM" and "(DEADBALL)" not in name \
-                                                    and "(TEAM)" not in name: 
-                if name not in missing and name:
-                    missing.append(name)
-                    
-        elif arg == 1:
-            replace = ["FOUL", "ENTERS THE GAME", "GOES TO THE BENCH", \
-                       "TURNOVER", "MISSED", "3-PT.", \
-                       "DEFENSIVE", "REBOUND", "OFFENSIVE", "DEADBALL", \
-                       "MADE", "ASSIST", "LAYUP", "STEAL", "BLOCK", \
-                       "TIP-IN",
-                       "THROW", "START OF PERIOD", "END OF PERIOD", "DUNK",\
-                       "TECHNICAL", "BY", "FREE", "JUMP", "SHOT", "TEAM"]
-            
-            name = row[mark]
-            
-            for word in replace:
-                name = name.replace(word, "")
-            
-            name = nice_name(name) 
-            
-            if name not in found and name != "" and name != ".":
-                if name not in missing:
-                    missing.append(name)
+        name = row.play(mark).player
+        if name and not found & player_bit(name):
+            missing.append(name)
+            found |= player_bit(name)
     
     return missing
 
 
+#one lineup rotation, see stint_index
+Stint = collections.namedtuple('Stint', ['first', 'stop', 'time_in', \
+                                         'time_out', 'seconds', 'score_in', \
+                                         'score_out', 'plus_minus', 'lineup', \
+                                         'team', 'opp'])
+
+
+'''
+Splits a game's play table into lineup rotations (stints) in one pass. A
+stint starts wherever the lineup changes (rows in the middle of a sub don't
+count) and at the start of every period. Its plays are rows first to stop
+(exclusive); the game's last row belongs to no stint's plays.
+
+A stint's time and score out are read from the row before the next stint
+starts, or the game's last row for the last stint. A stint that runs into the
+end of a period shows "00:00" out (the next row's clock is already higher).
+
+Args:
+in_table - play table from copy_table
+
+Returns:
+list of Stint, or None if there are too few lineup changes to believe the
+game has substitution data
+first, stop - rows of the stint's plays
+time_in, time_out, score_in, score_out - as written in the csv
+seconds - time on court
+plus_minus
+lineup - lineup (int) at the start of the stint, see player_bit
+team, opp - stats lists, see stat_line
+'''
+def stint_index(in_table):
+    starts = [] #row each stint starts on
+    counts = [] #(team, opponent) stat counts for each stint
+    lineup_atm = 0
+    last = len(in_table)-1
+    for n, row in enumerate(in_table):
+        if (lineup_atm != row.lineup and row.lineup != MIDSUB) \
+           or row.team_play.period == 'START':
+            starts.append(n)
+            counts.append((collections.Counter(), collections.Counter()))
+            lineup_atm = row.lineup
+        
+        if n != last and counts:
+            if row.team_play.stat:
+                counts[-1][0][row.team_play.stat] += 1
+            if row.opp_play.stat:
+                counts[-1][1][row.opp_play.stat] += 1
+    
+    if len(starts) < 6:
+        return None
+    
+    stints = []
+    for k, first in enumerate(starts):
+        start = in_table[first]
+        if k == len(starts)-1:
+            stop = last
+            end = in_table[last]
+        else:
+            stop = starts[k+1]
+            end = in_table[stop-1]
+        
+        if k != len(starts)-1 and row_clock(end) > row_clock(start):
+            time_out = "00:00"
+            seconds = row_clock(start)
+        else:
+            time_out = end.time
+            seconds = row_clock(start) - row_clock(end)
+        
+        stints.append(Stint(first, stop, start.time, time_out, seconds, \
+                            start.score, end.score, \
+                            row_margin(end) - row_margin(start), start.lineup, \
+                            stat_line(counts[k][0]), stat_line(counts[k][1])))
+    
+    return stints
+
+
 '''
 Takes the play data table created by copy_table and creates a table that holds
 data for each lineup rotation and the stats for that rotation.
@@ -558,8 +1904,7 @@ Team, Opponent, Lineup, Time @start of rotation, Time @end, Total time on court,
     2ptFGM, 2ptFGA, 3ptFGM, 3ptFGA, FTM, FTA, AST, TO, OREB, STL, BLK
 
 Args:
-in_table - game's play data table in nested list form (like the first entry
-           of the tuple returned by copy_table())
+in_table - game's play data table from copy_table(), split up by stint_index()
 names - tuple of (team_name, opponent_name) in nested list form (like that
         returned by get_team_names())
 filename - hostname.replace(' ', '').lower()
@@ -572,83 +1917,36 @@ no return
 def lineup_table(in_table, names, filename, date, arg):
     table = []
     
-    #find locations where lineup changes are made
-    subrows = [] #also has location of last row
-    lineup_atm = []
-    for n, row in enumerate(in_table):
-        if (lineup_atm != row[4] and row[4] != ["SUBSTITUTION IN PROGRESS"]) \
-           or "START OF" in row[2]:
-            subrows.append(n)
-            lineup_atm = row[4]
+    stints = stint_index(in_table)
     #handle games with no sub info
-    if len(subrows) < 6:
+    if stints is None:
         print "\nERROR: it's likely the game page exists with play-by-play " \
               "data but has no substitution information. Skipping game.\n\n"
         return
-    subrows.append(len(in_table)-1)
     
-    #print len(subrows), subrows, len(in_table)
+    date = date.encode('ascii', 'ignore')
     
     #calculate info for each rotation
-    for n, x in enumerate(subrows[:-1]):
-        temp = []
-        
-        temp.append(date.encode('ascii', 'ignore')) #date
-        temp.append(names[0]) #team name
-        temp.append(names[1]) #opponent name
-        temp.append(in_table[subrows[n]][0]) #start time
-        
-        #end time
-        if n == len(subrows[:-1])-1:
-            temp.append(in_table[subrows[n+1]][0])
-        else:
-            if time_convert(in_table[subrows[n+1]-1][0])>time_convert(temp[3]):
-                temp.append("00:00")
-            else:
-                temp.append(in_table[subrows[n+1]-1][0])
-        
-        temp.append(time_convert(temp[3]) - time_convert(temp[4])) #total time
-        temp.append(in_table[subrows[n]][1]) #score start
-        
-        #score end
-        if n == len(subrows[:-1])-1:
-            temp.append(in_table[subrows[n+1]][1])
-        else:
-            temp.append(in_table[subrows[n+1]-1][1])
-        
-        temp.append((plus_minus(temp[7])-plus_minus(temp[6]))) #+/-
+    for stint in stints:
+        temp = [date, names[0], names[1], stint.time_in, stint.time_out, \
+                stint.seconds, stint.score_in, stint.score_out, \
+                stint.plus_minus]
         
         #PUT SUB DATA INPUT ERROR ALGORITHM HERE
-        if len(in_table[subrows[n]][4]) != 5:
-            #print "\n", in_table[subrows[n]][1], in_table[subrows[n]][4]
-            in_table = minimize_input_errors(in_table, subrows, n, arg)
+        lineup = stint.lineup
+        if lineup_size(lineup) != 5:
+            lineup = minimize_input_errors(in_table, stint)
             
         #team lineup: 1 cell per player
+        lineup = lineup_names(lineup)
         for i in range(5):
-            if len(in_table[subrows[n]][4]) == 5:
-                temp.append(in_table[subrows[n]][4][i])
+            if i < len(lineup):
+                temp.append(lineup[i])
             else:
-                if i < len(in_table[subrows[n]][4]):
-                    temp.append(in_table[subrows[n]][4][i])
-                else:
-                    temp.append('')
-        #temp.append(in_table[subrows[n]][4]) #team lineup
-        #temp.append(in_table[subrows[n]][5]) #opponent lineup
+                temp.append('')
         
-        row_subset = in_table[subrows[n] : subrows[n+1]]
-        if arg == 0:
-            team_stats_holder = stats_sidearm(row_subset, 2)
-            opp_stats = stats_sidearm(row_subset, 3)
-        elif arg == 1:
-            team_stats_holder = stats_presto(row_subset, 2)
-            opp_stats = stats_presto(row_subset, 3)
-        elif arg == 2:
-            team_stats_holder = stats_cbsi(row_subset, 2)
-            opp_stats = stats_cbsi(row_subset, 3)
-        for m, s in enumerate(team_stats_holder):
-            temp.append((team_stats_holder[m]))
-        for a, b in enumerate(opp_stats):
-            temp.append((opp_stats[a]))
+        temp.extend(stint.team)
+        temp.extend(stint.opp)
                     
         table.append(temp)
             
@@ -675,171 +1973,206 @@ def lineup_table(in_table, names, filename, date, arg):
             
 
 '''
-Given a set of rows (representing all the play data for a given rotation),
-calculate all the box score data. Helper function used in lineup_table()
+How each provider writes its play details, as data for classify. Keyed by arg
+(0 - SidearmSports, 1 - PrestoSports, 2 - CBSi)
+
+stats - (code, strings, unless) checked in order. The first rule with one of
+        its strings in the detail and none of its unless strings wins
+sub_in, sub_out - (string that marks the sub, text to cut out to get the name)
+near_sub - strings that mean a detail is part of a substitution
+by - the acting player's name comes after this, or None if the name is what's
+     left after cutting out every string in strip
+strip - strings cut out of the name
+foul_details - cut out personal/team foul counts, see remove_foul_details
+not_players - names that aren't players
+not_in - names with one of these strings in them aren't players
+'''
+PLAY_RULES = {
+    0: {'stats': [('AST', ['ASSIST'], []),
+                  ('DREB', ['REBOUND DEF'], []),
+                  ('OREB', ['REBOUND OFF'], []),
+                  ('TO', ['TURNOVER'], []),
+                  ('FGM2', ['GOOD JUMPER', 'GOOD LAYUP', 'GOOD TIPIN', \
+                            'GOOD DUNK'], []),
+                  ('MISS2', ['MISS JUMPER', 'MISS LAYUP', 'MISS TIPIN', \
+                             'MISS DUNK'], []),
+                  ('FGM3', ['GOOD 3PTR'], []),
+                  ('MISS3', ['MISS 3PTR'], []),
+                  ('FTM', ['GOOD FT'], []),
+                  ('MISSFT', ['MISS FT'], []),
+                  ('STL', ['STEAL'], []),
+                  ('BLK', ['BLOCK'], []),
+                  ('FOUL', ['FOUL'], [])],
+        'sub_in': ("SUB IN", "SUB IN BY "),
+        'sub_out': ("SUB OUT", "SUB OUT BY "),
+        'near_sub': ["SUB"],
+        'by': " BY ",
+        'strip': ["(FASTBREAK)", "(IN THE PAINT)"],
+        'foul_details': False,
+        'not_players': ["TEAM"],
+        'not_in': []},
+    1: {'stats': [('AST', ['ASSIST'], []),
+                  ('DREB', ['DEFENSIVE REBOUND'], []),
+                  ('OREB', ['OFFENSIVE REBOUND'], []),
+                  ('TO', ['TURNOVER'], []),
+                  ('FGM2', ['MADE JUMP SHOT', 'MADE LAYUP', 'MADE DUNK'], []),
+                  ('MISS2', ['MISSED JUMP SHOT', 'MISSED LAYUP', \
+                             'MISSED DUNK'], []),
+                  ('FGM3', ['MADE 3-PT. JUMP SHOT'], []),
+                  ('MISS3', ['MISSED 3-PT. JUMP SHOT'], []),
+                  ('FTM', ['MADE FREE THROW'], []),
+                  ('MISSFT', ['MISSED FREE THROW'], []),
+                  ('STL', ['STEAL'], []),
+                  ('BLK', ['BLOCK'], []),
+                  ('FOUL', ['FOUL'], [])],
+        'sub_in': ("ENTERS THE GAME", "ENTERS THE GAME"),
+        'sub_out': ("GOES TO THE BENCH", "GOES TO THE BENCH"),
+        'near_sub': ["ENTERS THE", "TO THE BENCH"],
+        'by': None,
+        'strip': ["FOUL", "ENTERS THE GAME", "GOES TO THE BENCH", \
+                  "TURNOVER", "MISSED", "3-PT.", \
+                  "DEFENSIVE", "REBOUND", "OFFENSIVE", "DEADBALL", \
+                  "MADE", "ASSIST", "LAYUP", "STEAL", "BLOCK", \
+                  "THROW", "START OF PERIOD", "END OF PERIOD", "DUNK",\
+                  "TIP-IN",
+                  "TECHNICAL", "BY", "FREE", "JUMP", "SHOT"],
+        'foul_details': False,
+        'not_players': ["."],
+        'not_in': ["TEAM"]},
+    2: {'stats': [('AST', ['ASSIST'], []),
+                  #reb by deadball doesn't count
+                  ('DREB', ['REBOUND (DEF)'], ["(DEADBALL)"]),
+                  ('OREB', ['REBOUND (OFF)'], ["(DEADBALL)"]),
+                  ('TO', ['TURNOVR'], []),
+                  ('FGM2', ['GOOD! JUMPER', 'GOOD! LAYUP', 'GOOD! TIP-IN', \
+                            'GOOD! DUNK'], []),
+                  ('MISS2', ['MISSED JUMPER', 'MISSED LAYUP', \
+                             'MISSED DUNK'], []),
+                  ('FGM3', ['GOOD! 3 PTR'], []),
+                  ('MISS3', ['MISSED 3 PTR'], []),
+                  ('FTM', ['GOOD! FT SHOT'], []),
+                  ('MISSFT', ['MISSED FT SHOT'], []),
+                  ('STL', ['STEAL'], []),
+                  ('BLK', ['BLOCK'], []),
+                  ('FOUL', ['FOUL'], [])],
+        'sub_in': ("SUB IN", "SUB IN : "),
+        'sub_out': ("SUB OUT", "SUB OUT: "),
+        'near_sub': ["SUB"],
+        'by': " BY ",
+        'strip': ['[FB/PNT]', '[PNT]', '[FB]', 'THE BENCH'],
+        'foul_details': True,
+        'not_players': ["TEAM"],
+        'not_in': ["(DEADBALL)", "(TEAM)"]}
+}
+
+'''
+What classify makes of one play detail
+
+stat - code from PLAY_RULES stats, or None
+period - 'START' or 'END' for start/end of period rows, otherwise None
+sub - 'IN' or 'OUT' for substitutions, otherwise None
+sub_player - who subbed in or out (nice_name form)
+player - player the detail mentions (nice_name form), None if it's nobody
+near_sub - True if the detail is part of a substitution
+'''
+Play = collections.namedtuple('Play', ['stat', 'period', 'sub', 'sub_player', \
+                                       'player', 'near_sub'])
+
+#(detail, arg) -> Play, see classify
+_plays = {}
+MAX_PLAYS = 100000 #classify starts over once it has seen this many details
+
+
+'''
+Reads a play detail once and returns a Play with everything the lineup and
+stats code wants to know about it. Each provider's wording comes from
+PLAY_RULES. The same detail string gets read for the team and the opponent,
+for every stint and every fix-up pass, so answers are kept in _plays.
+
+Args:
+detail - a play detail string
+arg - 0 (SidearmSports), 1 (PrestoSports), 2 (CBSi)
+
+Returns: Play
+'''
+def classify(detail, arg):
+    key = (detail, arg)
+    play = _plays.get(key)
+    if play is not None:
+        return play
+    
+    rules = PLAY_RULES[arg]
+    
+    stat = None
+    for code, strings, unless in rules['stats']:
+        if any(s in detail for s in strings) and \
+           not any(u in detail for u in unless):
+            stat = code
+            break
+    
+    period = None
+    sub = None
+    sub_player = None
+    if "END OF" in detail:
+        period = 'END'
+    elif "START OF" in detail:
+        period = 'START'
+    elif rules['sub_in'][0] in detail:
+        sub = 'IN'
+        sub_player = nice_name(detail.replace(rules['sub_in'][1], ""))
+    elif rules['sub_out'][0] in detail:
+        sub = 'OUT'
+        sub_player = nice_name(detail.replace(rules['sub_out'][1], ""))
+    
+    player = None
+    if rules['by'] is None:
+        player = detail
+    elif rules['by'] in detail:
+        player = detail[detail.find(rules['by'])+len(rules['by']):]
+    if player is not None:
+        for s in rules['strip']:
+            player = player.replace(s, "")
+        if rules['foul_details']:
+            player = remove_foul_details(player)
+        player = nice_name(player)
+        if not player or player in rules['not_players'] or \
+           any(s in player for s in rules['not_in']):
+            player = None
+    
+    near_sub = any(s in detail for s in rules['near_sub'])
+    
+    play = Play(stat, period, sub, sub_player, player, near_sub)
+    if len(_plays) >= MAX_PLAYS:
+        _plays.clear()
+    _plays[key] = play
+    return play
+
+
+'''
+Given the counts of each stat code (see PLAY_RULES) in a rotation's plays,
+calculate all the box score data. Helper function used in stint_index()
 
 Args:
-rows - subset of rows of in_table
-col - column to read data from. will be 2 for team data, 3 for opponent data
+count - stat code -> number of plays, for the team or the opponent
 
 Returns:
 stats - list of all stats in the following format
-        [POSSESSIONS, 2ptFGM, 2ptFGA, 3ptFGM, 3ptFGA, FTA, FTM, AST, TO,
-        OREB, DREB, STL, BLK, FOULS]
+        [POSSESSIONS, FGM, FGA, 2ptFGM, 2ptFGA, 3ptFGM, 3ptFGA, FTM, FTA, AST,
+        TO, OREB, DREB, STL, BLK, FOULS]
         
 ALSO POSSIBLE TO CALCULATE:
 POINTS IN THE PAINT
 FAST BREAK POINTS
 POINTS
 FGM/FGA
-
-ASSUMPTIONS:
-only shot types are JUMPER, LAYUP, 3PTR, FT, TIPIN, DUNK
-'''
-def stats_sidearm(rows, col):
-    #print "stats sidearm"
-    fgm_2 = 0; fga_2 = 0; fgm_3 = 0; fga_3 = 0; fta = 0; ftm = 0; ast = 0
-    to = 0; dreb = 0; oreb = 0; stl = 0; blk = 0; foul = 0
-    
-    for row in rows:
-        if 'ASSIST' in row[col]:
-            ast += 1
-        elif 'REBOUND DEF' in row[col]:# or 'REBOUND DEADB' in row[col]:
-            dreb += 1
-        elif 'REBOUND OFF' in row[col]:
-            oreb += 1
-        elif 'TURNOVER' in row[col]:
-            to += 1
-        elif 'GOOD JUMPER' in row[col] or 'GOOD LAYUP' in row[col] \
-             or 'GOOD TIPIN' in row[col] or 'GOOD DUNK' in row[col]:
-            fgm_2 += 1
-            fga_2 += 1
-        elif 'MISS JUMPER' in row[col] or 'MISS LAYUP' in row[col] \
-             or 'MISS TIPIN' in row[col] or 'MISS DUNK' in row[col]:
-            fga_2 = fga_2 + 1
-        elif 'GOOD 3PTR' in row[col]:
-            fgm_3 += 1
-            fga_3 += 1
-        elif 'MISS 3PTR' in row[col]:
-            fga_3 += 1
-        elif 'GOOD FT' in row[col]:
-            ftm += 1
-            fta += 1
-        elif 'MISS FT' in row[col]:
-            fta += 1
-        elif 'STEAL' in row[col]:
-            stl += 1
-        elif 'BLOCK' in row[col]:
-            blk += 1
-        elif 'FOUL' in row[col]:
-            foul += 1
-    
-    fga = fga_2 + fga_3
-    fgm = fgm_2 + fgm_3
-    poss = fga + (fta * POSS_RATIO) + to - oreb
-
-    return [poss, fgm, fga, fgm_2, fga_2, fgm_3, fga_3, ftm, fta, ast, to, \
-            oreb, dreb, stl, blk, foul]
-
-
-'''
-Same as stats_sidearm except this one works on PrestoSports provided pbps
-
-ASSUMPTIONS:
-only shot types are 3-PT. JUMP SHOT, JUMP SHOT, LAYUP, 3PTR, FREE THROW,
-DUNK
-'''
-def stats_cbsi(rows, col):
-    #print "stats cbsi"
-    fgm_2 = 0; fga_2 = 0; fgm_3 = 0; fga_3 = 0; fta = 0; ftm = 0; ast = 0
-    to = 0; dreb = 0; oreb = 0; stl = 0; blk = 0; foul = 0
-    
-    for row in rows:
-        if 'ASSIST' in row[col]:
-            ast += 1
-        #reb by deadball doesn't count
-        elif 'REBOUND (DEF)' in row[col] and "(DEADBALL)" not in row[col]:
-            dreb += 1
-        elif 'REBOUND (OFF)' in row[col] and "(DEADBALL)" not in row[col]:
-            oreb += 1
-        elif 'TURNOVR' in row[col]:
-            to += 1
-        elif 'GOOD! JUMPER' in row[col] or 'GOOD! LAYUP' in row[col] \
-             or 'GOOD! TIP-IN' in row[col] or 'GOOD! DUNK' in row[col]:
-            fgm_2 += 1
-            fga_2 += 1
-        elif 'MISSED JUMPER' in row[col] or 'MISSED LAYUP' in row[col] \
-             or 'MISSED DUNK' in row[col] or 'MISSED DUNK' in row[col]:
-            fga_2 = fga_2 + 1
-        elif 'GOOD! 3 PTR' in row[col]:
-            fgm_3 += 1
-            fga_3 += 1
-        elif 'MISSED 3 PTR' in row[col]:
-            fga_3 += 1
-        elif 'GOOD! FT SHOT' in row[col]:
-            ftm += 1
-            fta += 1
-        elif 'MISSED FT SHOT' in row[col]:
-            fta += 1
-        elif 'STEAL' in row[col]:
-            stl += 1
-        elif 'BLOCK' in row[col]:
-            blk += 1
-        elif 'FOUL' in row[col]:
-            foul += 1
-    
-    fga = fga_2 + fga_3
-    fgm = fgm_2 + fgm_3
-    poss = fga + (fta * POSS_RATIO) + to - oreb
-
-    return [poss, fgm, fga, fgm_2, fga_2, fgm_3, fga_3, ftm, fta, ast, to, \
-            oreb, dreb, stl, blk, foul]
-
-
 '''
-Same as stats_sidearm except this one works on PrestoSports provided pbps
-
-ASSUMPTIONS:
-only shot types are 3-PT. JUMP SHOT, JUMP SHOT, LAYUP, 3PTR, FREE THROW,
-DUNK
-'''
-def stats_presto(rows, col):
-    #print "stats presto"
-    fgm_2 = 0; fga_2 = 0; fgm_3 = 0; fga_3 = 0; fta = 0; ftm = 0; ast = 0
-    to = 0; dreb = 0; oreb = 0; stl = 0; blk = 0; foul = 0
-    
-    for row in rows:
-        if 'ASSIST' in row[col]:
-            ast += 1
-        elif 'DEFENSIVE REBOUND' in row[col]:# or 'REBOUND DEADB' in row[col]:
-            dreb += 1
-        elif 'OFFENSIVE REBOUND' in row[col]:
-            oreb += 1
-        elif 'TURNOVER' in row[col]:
-            to += 1
-        elif 'MADE JUMP SHOT' in row[col] or 'MADE LAYUP' in row[col] \
-             or 'MADE DUNK' in row[col]:
-            fgm_2 += 1
-            fga_2 += 1
-        elif 'MISSED JUMP SHOT' in row[col] or 'MISSED LAYUP' in row[col] \
-             or 'MISSED DUNK' in row[col]:
-            fga_2 = fga_2 + 1
-        elif 'MADE 3-PT. JUMP SHOT' in row[col]:
-            fgm_3 += 1
-            fga_3 += 1
-        elif 'MISSED 3-PT. JUMP SHOT' in row[col]:
-            fga_3 += 1
-        elif 'MADE FREE THROW' in row[col]:
-            ftm += 1
-            fta += 1
-        elif 'MISSED FREE THROW' in row[col]:
-            fta += 1
-        elif 'STEAL' in row[col]:
-            stl += 1
-        elif 'BLOCK' in row[col]:
-            blk += 1
-        elif 'FOUL' in row[col]:
-            foul += 1
+def stat_line(count):
+    fgm_2 = count['FGM2']; fga_2 = count['FGM2'] + count['MISS2']
+    fgm_3 = count['FGM3']; fga_3 = count['FGM3'] + count['MISS3']
+    ftm = count['FTM']; fta = count['FTM'] + count['MISSFT']
+    ast = count['AST']; to = count['TO']; oreb = count['OREB']
+    dreb = count['DREB']; stl = count['STL']; blk = count['BLK']
+    foul = count['FOUL']
     
     fga = fga_2 + fga_3
     fgm = fgm_2 + fgm_3
@@ -914,127 +2247,39 @@ For the flawed lineups that we can't fix, just throw away the data as suggested
 
 ARGS:
 in_table
-subrows - locations of rows of in_table where substitutions occur
-index - current index of subrows in the iteration at the time of call
-arg
+stint - the Stint to check, see stint_index
 
 Returns:
-new_in_table - only if changes are made to the original 
+lineup - the lineup (int) to use for the stint. The table itself is never
+         changed
 '''
-def minimize_input_errors(in_table, subrows, index, arg):
-    if index == len(subrows)-1: return in_table #dont get last index of subrow
+def minimize_input_errors(in_table, stint):
+    lineup = stint.lineup
     
     #IF WE NEED TO FIND A 'MISSING' PLAYER:
-    if len(in_table[subrows[index]][4]) < 5:
-        to_add = []
-    
-        for n, row in enumerate(in_table[ subrows[index] : subrows[index+1] ]):
-            if arg == 0: #SidearmSports
-                if "BY" in row[2] and "SUB " not in row[2]:
-                    name = row[2][row[2].find(' BY ')+4:].\
-                        replace("(FASTBREAK)","").replace("(IN THE PAINT)", "")
-                    name = nice_name(name)
-                    
-                    if name not in row[4]:
-                        if name not in to_add and name != "TEAM":
-                            to_add.append(name)
-                            
-            elif arg == 1: #PrestoSports
-                replace = ["FOUL", "ENTERS THE GAME", "GOES TO THE BENCH", \
-                           "TURNOVER", "MISSED", "3-PT.", \
-                           "DEFENSIVE", "REBOUND", "OFFENSIVE", "DEADBALL", \
-                           "MADE", "ASSIST", "LAYUP", "STEAL", "BLOCK", \
-                           "THROW", "START OF PERIOD", "END OF PERIOD", "DUNK",\
-                           "TIP-IN",
-                           "TECHNICAL", "BY", "FREE", "JUMP", "SHOT"]
-                
-                name = row[2]
+    size = lineup_size(lineup)
+    if size < 5:
+        to_add = 0
+    
+        for n in range(stint.first, stint.stop):
+            row = in_table[n]
+            play = row.team_play
+            name = play.player
+            if name and not play.sub and not row.lineup & player_bit(name):
+                to_add |= player_bit(name)
                 
-                for word in replace:
-                    name = name.replace(word, "")
-                name = nice_name(name)
-                
-                if name not in row[4] and "TEAM" not in name and name != "" \
-                                      and "ENTERS THE GAME" not in row[2]\
-                                      and "GOES TO THE BENCH" not in row[2]:
-                    if name not in to_add:
-                        to_add.append(name)
-                    
-            elif arg == 2: #CBSi
-                if " BY " in row[2]:
-                    name = row[2][row[2].find(' BY ')+4:].\
-                        replace('[FB/PNT]', '').replace('[PNT]', '').\
-                        replace('[FB]', '').replace('THE BENCH', '')
-                    name = remove_foul_details(name)
-                    name = nice_name(name)
-                    
-                    if name not in row[4] and "(DEADBALL)" not in name \
-                                          and "(TEAM)" not in name:
-                        if name not in to_add:
-                            to_add.append(name)
-                
-        
-        if len(to_add) > 0:
-            new_table = copy.deepcopy(in_table)
-            for name in to_add:
-                for n, row in enumerate(new_table[subrows[index]: \
-                                                 subrows[index+1]]):
-                    row[4].append(name)
-                    row[4] = sorted(row[4])
-            
-            #print "Reduced sub data input errors! Added:", to_add
-            return new_table
-        #else:
-            #print "found nothing new "
+        #print "Reduced sub data input errors! Added:", lineup_names(to_add)
+        return lineup | to_add
     
     #IF WE NEED TO REMOVE THE EXTRA PLAYERS
-    elif len(in_table[subrows[index]][4]) > 5:
+    elif size > 5:
         true_court = []
         
-        for n, row in enumerate(in_table[ subrows[index] : subrows[index+1] ]):
-            if arg == 0: #SidearmSports
-                if "BY" in row[2]:
-                    name = row[2][row[2].find(' BY ')+4:].\
-                        replace("(FASTBREAK)","").replace("(IN THE PAINT)", "")
-                    name = nice_name(name)
-                    
-                    if name != "TEAM" and "SUB " not in row[2]:
-                        if name not in true_court:
-                            true_court.append(name)
-                            
-            elif arg == 1: #PrestoSports
-                replace = ["FOUL", "ENTERS THE GAME", "GOES TO THE BENCH", \
-                           "TURNOVER", "MISSED", "3-PT.", \
-                           "DEFENSIVE", "REBOUND", "OFFENSIVE", "DEADBALL", \
-                           "MADE", "ASSIST", "LAYUP", "STEAL", "BLOCK", \
-                           "THROW", "START OF PERIOD", "END OF PERIOD", "DUNK",\
-                           "TIP-IN",
-                           "TECHNICAL", "BY", "FREE", "JUMP", "SHOT"]
-                
-                name = row[2]
-                
-                for word in replace:
-                    name = name.replace(word, "")
-                name = nice_name(name) 
-                
-                if name not in true_court and "TEAM" not in name and name != "" \
-                                      and "ENTERS THE GAME" not in row[2]\
-                                      and "GOES TO THE BENCH" not in row[2]:
-                    true_court.append(name)
-                        
-            elif arg == 2: #CBSi
-                if " BY " in row[2]:
-                    name = row[2][row[2].find(' BY ')+4:].\
-                        replace('[FB/PNT]', '').replace('[PNT]', '').\
-                        replace('[FB]', '').replace('SUB IN : ', '').\
-                        replace('THE BENCH', '')
-                    name = remove_foul_details(name)
-                    name = nice_name(name)
-                    #name = name.replace(' ', '')
-                    
-                    if name not in true_court and "(DEADBALL)" not in name \
-                                              and "(TEAM)" not in name:
-                        true_court.append(name)
+        for n in range(stint.first, stint.stop):
+            play = in_table[n].team_play
+            name = play.player
+            if name and not play.sub and name not in true_court:
+                true_court.append(name)
                         
         #if players in true_court exceeds 5, then the pbp data is so screwed up
         #.. that we still don't know who's on the court so reset to empty
@@ -1044,24 +2289,10 @@ def minimize_input_errors(in_table, subrows, index, arg):
         #whatever true_court may be, replace the current, flawed lineup
         #because at least we know the players we have were actually on the
         #court and we can still evaluate 4, 3, or even 2-man efficiencies    
-        new_table = copy.deepcopy(in_table)
-        if not true_court:
-            z = subrows[index]
-            x = new_table[subrows[index]][4]
-            y = new_table[subrows[index]]
-            for n, row in enumerate(new_table[subrows[index]: \
-                                             subrows[index+1]]):
-                row[4] = sorted(true_court)
-        else:
-            for lineup in true_court:
-                for n, row in enumerate(new_table[subrows[index]: \
-                                                 subrows[index+1]]):
-                    row[4] = sorted(true_court)
-
         #print "Reduced sub data input errors. New:", true_court
-        return new_table
+        return lineup_mask(true_court)
     
-    return in_table
+    return lineup
     
     
 '''
@@ -1083,72 +2314,20 @@ def menwomen(soup):
 
 
 '''
-Driver that runs get_teamnames, gets user input if the team names don't match
-the given hostname, and finds homeaway and team names (in correct order)
+Driver that runs get_teamnames and works out homeaway and team names (in
+correct order), see resolve_teamnames
 
 Args:
 soup
 hostname
+link - boxscore url
 
 Returns:
 (homeaway, teamnames)
 '''
-def run_teamnames(soup, hostname):
+def run_teamnames(soup, hostname, link=None):
     teamnames = get_team_names(soup)
-    awayteam = teamnames[0].upper()
-    hometeam = teamnames[1].upper()
-    
-    homeaway = ""
-    if awayteam == hostname:
-        homeaway = "AWAY"
-        teamnames = (awayteam, hometeam)
-    elif hometeam == hostname:
-        homeaway = "HOME"
-        teamnames = (hometeam, awayteam)
-    else:
-        #handle msu vs michigan game hostname: michigan state
-        if hostname == awayteam.replace(' STATE', '').replace(' ST', '') or \
-           hostname == hometeam.replace(' STATE', '').replace(' ST', '') or \
-           hostname == hometeam + " STATE" or \
-           hostname == awayteam + " STATE" or \
-           hostname == hometeam + " ST" or \
-           hostname == awayteam + " ST":
-            pass
-        else:
-            print "running similar()..."
-            print awayteam, hometeam
-            home_similar = le2.similar(hostname, hometeam)
-            away_similar = le2.similar(hostname, awayteam)
-    
-            if home_similar > away_similar and home_similar > 0.7:
-                print "similarity:", home_similar
-                homeaway = "HOME"
-                teamnames = (hostname, awayteam)
-                return homeaway, teamnames
-            elif away_similar > home_similar and away_similar > 0.7:
-                print "similarity:", away_similar
-                homeaway = "AWAY"
-                teamnames = (hostname, hometeam)
-                return homeaway, teamnames
-
-        print ("\n\nThe boxscore page is using a different name than"
-               " the given hostname. Do either of these options look like "
-               "they could be for the host team?")
-        print "\nTeam A:", awayteam, "\nTeam B:", hometeam
-        selection = raw_input("\n'A' or 'B' or 'neither': ").upper()
-        if selection == 'A':
-            homeaway = "AWAY"
-            teamnames = (hostname, hometeam)
-        elif selection == 'B':
-            homeaway = "HOME"
-            teamnames = (hostname, awayteam)
-        else:
-            raise UserWarning("\n\nERROR MESSAGE: Something went wrong "\
-                              "determining", "home/away teams.\nCheck if "\
-                              "hostname argument was " \
-                              "entered correctly\nExiting...\n\n")
-    
-    return homeaway, teamnames
+    return resolve_teamnames(hostname, teamnames, link)
 
 
 '''
@@ -1166,12 +2345,21 @@ def scrape_all(soup, schedule_url, hostname):
         print "All available data has been scraped alraedy, according to", \
               "TEAMNAME_DONE.txt" 
     
-    for l in links:        
+    added = 0 #games appended to HOSTNAME_all_lineups.csv
+    pages = download_all(links, get_boxscore_page)
+    for l, soup in itertools.izip(links, pages):
         print "WORKING ON:", l
         
-        soup = get_site(l)    
+        if not_final(status_is_final(soup), l):
+            soup.decompose()
+            continue
         
-        homeaway, teamnames = run_teamnames(soup, hostname)
+        try:
+            homeaway, teamnames = run_teamnames(soup, hostname, l)
+        except UnresolvedTeamName as e:
+            print e, "\n"
+            soup.decompose()
+            continue
         
         mw = menwomen(soup)
         
@@ -1181,12 +2369,19 @@ def scrape_all(soup, schedule_url, hostname):
         arg = 0
         
         starters = get_starters(soup, homeaway)
-        if not starters:
+        if starters == []:
+            #left out of the DONE file so it's tried again next run
+            print "skipping game without lineups for now\n"
+            soup.decompose()
+            continue
+        elif not starters:
             print "skipping exhibition game"
         else:
             pbp = get_pbp(soup, homeaway, mw)
             play_table = copy_table(pbp, starters, arg)
             lineup_table(play_table, teamnames, filename, get_date(soup), arg)
+            added = added + 1
+        soup.decompose() #free the page before the next one gets parsed
         
         #ADD GAME URL TO READ_ALREADY FILE
         with open(hostname.replace(' ', '').lower()+"DONE.txt",'a') as file:
@@ -1194,7 +2389,8 @@ def scrape_all(soup, schedule_url, hostname):
 
         print "\n"
     
-    dataframe(hostname) #111
+    if added or REFRESH_UNCHANGED:
+        dataframe(hostname) #111
     
 
 '''
@@ -1228,7 +2424,13 @@ def dataframe(hostname):
     
     df = df.fillna('MISSING')
     
-    df = df.groupby(['TEAM','TEAM A','TEAM B','TEAM C','TEAM D','TEAM E'], \
+    #group on one integer per lineup, then put the names back and sort the
+    #..groups the way grouping on the name columns did
+    players = ['TEAM A','TEAM B','TEAM C','TEAM D','TEAM E']
+    df['LINEUP'] = [lineup_key(names) for names in \
+                    zip(*[df[col].astype(str) for col in players])]
+    names = df.drop_duplicates('LINEUP').set_index('LINEUP')[players]
+    df = df.groupby(['TEAM','LINEUP'], \
                     as_index=False)[['TOTAL TIME','+/-',"POSS.","FGM","FGA",\
                      "2ptFGM","2ptFGA","3ptFGM","3ptFGA","FTM",\
                      "FTA","AST","TO","OREB","DREB","STL","BLK","FOULS",\
@@ -1236,6 +2438,10 @@ def dataframe(hostname):
                      "Opp 3ptFGM","Opp 3ptFGA","Opp FTM","Opp FTA","Opp AST",\
                      "Opp TO","Opp OREB","Opp DREB","Opp STL","Opp BLK",\
                      "Opp FOULS"]].sum()
+    df = df.join(names, on='LINEUP')
+    df = df[['TEAM'] + players + [col for col in df.columns \
+                                  if col not in ['TEAM', 'LINEUP'] + players]]
+    df = df.sort_values(['TEAM'] + players).reset_index(drop=True)
     df = df.sort_values("TOTAL TIME", ascending=False)
     #df['TOTAL TIME'] = df['TOTAL TIME'].apply(to_clock)
     df = df.reset_index(drop=True)
@@ -1247,7 +2453,7 @@ def dataframe(hostname):
     for n in range(1, 5):
         dfn = n_player_lineups(df, n)
         filename_n = filename_base.upper() + '%s.csv' % (str(n))
-        dfn.to_csv(filename_n)
+        write_file_atomic(filename_n, dfn.to_csv())
     
     
     #5-PLAYER LINEUPS
@@ -1267,7 +2473,7 @@ def dataframe(hostname):
     #print df5.to_string()
     
     filename_5 = filename_base.upper() + '5.csv'
-    df5.to_csv(filename_5)
+    write_file_atomic(filename_5, df5.to_csv())
     
 
 '''
@@ -1681,12 +2887,92 @@ def get_boxscores(bigsoup, schedule_url, hostname):
     return links
 
 
+#spelling -> LASTNAME.FIRSTNAME for the team being scraped, see load_aliases
+_aliases = {}
+
+#name -> nice_name(name), least recently used first
+_names = collections.OrderedDict()
+_names_stats = {'hits': 0, 'misses': 0, 'aliases': 0}
+_names_lock = threading.Lock() #nice_name gets called from download threads
+MAX_NAMES = 20000 #spellings nice_name remembers before dropping the oldest
+
+
 '''
-Handle all different ways we encounter names
+Loads the alias table for one team, HOSTNAME_aliases.csv in the cwd. Each row
+is a spelling seen on the site and the LASTNAME.FIRSTNAME it should become,
+e.g.
+
+"JR,ERIC DAVIS",DAVIS.ERIC
+"Smtih, John",SMITH.JOHN
+
+Spellings are matched after stripping and upper-casing. A team with no file
+just gets no aliases. Names and plays worked out under the last team's table
+are forgotten (see nice_name and classify), so none of its aliases carry over.
+
+Args:
+hostname
+'''
+def load_aliases(hostname):
+    global _aliases
+    aliases = {}
+    path = hostname.replace(' ', '').lower() + '_aliases.csv'
+    try:
+        with open(path, 'rb') as file:
+            for row in csv.reader(file):
+                if len(row) >= 2 and row[0].strip() and row[1].strip():
+                    aliases[row[0].strip().upper()] = row[1].strip().upper()
+    except IOError:
+        pass
+    with _names_lock:
+        _aliases = aliases
+        _names.clear()
+    _plays.clear()
+
+
+'''
+Returns how nice_name has been doing:
+{'hits', 'misses', 'aliases', 'size', 'hit_rate'}
+'''
+def name_cache_info():
+    info = dict(_names_stats)
+    info['size'] = len(_names)
+    calls = info['hits'] + info['misses'] + info['aliases']
+    info['hit_rate'] = (info['hits'] + info['aliases']) / float(calls) \
+                       if calls else 0.0
+    return info
+
+
+'''
+Handle all different ways we encounter names. Spellings in the team's alias
+table (see load_aliases) win, then names already worked out, and anything
+new goes through parse_name.
 
 Return name in format: LASTNAME.FIRSTNAME
 '''
 def nice_name(name):
+    with _names_lock:
+        if _aliases:
+            alias = _aliases.get(name.strip().upper())
+            if alias is not None:
+                _names_stats['aliases'] += 1
+                return alias
+        
+        try:
+            nice = _names.pop(name)
+            _names_stats['hits'] += 1
+        except KeyError:
+            nice = parse_name(name)
+            _names_stats['misses'] += 1
+            if len(_names) >= MAX_NAMES:
+                _names.popitem(last=False)
+        _names[name] = nice
+        return nice
+
+
+'''
+Does the work for nice_name, without the alias table or remembered names
+'''
+def parse_name(name):
     name = name.rstrip().strip().upper().encode('ascii', 'ignore')
 
     #strip of leading and trailing periods/commas
@@ -1788,13 +3074,16 @@ def remove_foul_details(string):
 
 '''
 Helper used in get_boxscores for comparing links scraped from site to links
-saved in TEAMNAMEDONE.txt file.
+saved in TEAMNAMEDONE.txt file. Replaying a page archive reads every game
+again, so the file is ignored then
 
 Returns:
 read_already - set with all links to not double-scrape
 '''
 def been_read(hostname):
     read_already = set()
+    if ARCHIVE_MODE == 'replay':
+        return read_already
     try:
         with open(hostname.replace(' ', '').lower()+"DONE.txt",'r') as file:
             read = file.read().splitlines()
@@ -1810,12 +3099,237 @@ def been_read(hostname):
 '''
 Used to handle team name inconsistency issues.
 Ex: Wichita St. vs Wichita State
-Called in run_teamnames
+Called in resolve_teamnames
 '''
 def similar(a, b):
     return SequenceMatcher(None, a, b).ratio()
 
 
+#raised by resolve_teamnames in batch mode for a game it had to queue
+class UnresolvedTeamName(UserWarning):
+    pass
+
+
+#hostname -> set of normalized names known to mean the host team, and
+#..hostname -> {trigram: set of those names}, see load_teamnames
+_teamnames = None
+_teamname_grams = {}
+
+#(hostname, away, home) already waiting in TEAMNAMES_QUEUE
+_teamnames_queued = None
+
+
+'''
+Puts a school name in the form names are compared in: upper case, no
+ranking mark, no punctuation, single spaces.
+Ex: "#9 St. John's (NY)" -> "ST JOHNS NY"
+'''
+def normalize_team(name):
+    name = re.sub(r'#\d+\s*', '', name.upper())
+    name = name.replace('&', ' AND ').replace("'", '').replace('.', '')
+    return ' '.join(re.sub(r'[^A-Z0-9]', ' ', name).split())
+
+
+'''
+Three letter pieces of a normalized name, used to find names worth comparing
+'''
+def trigrams(name):
+    name = ' ' + name + ' '
+    return set(name[i:i+3] for i in range(len(name)-2))
+
+
+'''
+Reads TEAMNAMES_FILE (rows of hostname, name that means the host team) into
+the alias index the first time it's needed
+'''
+def load_teamnames():
+    global _teamnames
+    if _teamnames is not None:
+        return
+    _teamnames = {}
+    try:
+        with open(TEAMNAMES_FILE, 'rb') as file:
+            for row in csv.reader(file):
+                if len(row) >= 2:
+                    add_teamname(row[0], row[1])
+    except IOError:
+        pass
+
+
+'''
+Adds name to the host team's aliases and their trigram index
+'''
+def add_teamname(hostname, name):
+    load_teamnames()
+    name = normalize_team(name)
+    names = _teamnames.setdefault(hostname, set())
+    if not name or name in names:
+        return
+    names.add(name)
+    grams = _teamname_grams.setdefault(hostname, {})
+    for gram in trigrams(name):
+        grams.setdefault(gram, set()).add(name)
+
+
+'''
+Adds name to the host team's aliases and saves it in TEAMNAMES_FILE so it's
+known on every run after this one
+'''
+def remember_teamname(hostname, name):
+    add_teamname(hostname, name)
+    with open(TEAMNAMES_FILE, 'ab') as file:
+        csv.writer(file).writerow([hostname, normalize_team(name)])
+
+
+'''
+How much name looks like the host team, 0 to 1. 1 for the hostname itself
+or a known alias, otherwise the best similar() against the aliases sharing
+a trigram with it
+'''
+def teamname_score(hostname, name):
+    add_teamname(hostname, hostname)
+    name = normalize_team(name)
+    if name in _teamnames[hostname]:
+        return 1.0
+    
+    grams = _teamname_grams[hostname]
+    candidates = set()
+    for gram in trigrams(name):
+        candidates.update(grams.get(gram, ()))
+    return max([similar(name, c) for c in candidates] or [0])
+
+
+'''
+Works out which of a boxscore's teams is the host team. Names that match the
+hostname or one of its aliases in TEAMNAMES_FILE resolve straight away. After
+that the closest name wins if it's similar enough (SIMILAR_TEAM), unless one
+name is just the other with STATE/ST on it (Michigan vs Michigan State).
+
+Anything still unresolved is asked about, and the answer is remembered. In
+batch mode (TEAMNAMES_BATCH) the game is written to TEAMNAMES_QUEUE instead
+and UnresolvedTeamName is raised, so the caller can skip it without marking it
+done. It gets picked up again on the next run once the queue has been
+answered (see resolve_queue) or TEAMNAMES_FILE has been edited.
+
+Args:
+hostname
+teamnames - (AWAY_NAME, HOME_NAME) as read from the boxscore
+link - boxscore url, for the queue
+
+Returns:
+(homeaway, teamnames) with teamnames as (host, opponent)
+'''
+def resolve_teamnames(hostname, teamnames, link=None):
+    awayteam = teamnames[0].upper()
+    hometeam = teamnames[1].upper()
+    
+    if awayteam == hostname:
+        return "AWAY", (awayteam, hometeam)
+    elif hometeam == hostname:
+        return "HOME", (hometeam, awayteam)
+    
+    away_similar = teamname_score(hostname, awayteam)
+    home_similar = teamname_score(hostname, hometeam)
+    if away_similar == 1 and home_similar < 1:
+        return "AWAY", (hostname, hometeam)
+    elif home_similar == 1 and away_similar < 1:
+        return "HOME", (hostname, awayteam)
+    
+    #handle msu vs michigan game hostname: michigan state
+    if not (hostname == awayteam.replace(' STATE', '').replace(' ST', '') or \
+            hostname == hometeam.replace(' STATE', '').replace(' ST', '') or \
+            hostname == hometeam + " STATE" or \
+            hostname == awayteam + " STATE" or \
+            hostname == hometeam + " ST" or \
+            hostname == awayteam + " ST"):
+        if home_similar > away_similar and home_similar > SIMILAR_TEAM:
+            print "similarity:", home_similar
+            return "HOME", (hostname, awayteam)
+        elif away_similar > home_similar and away_similar > SIMILAR_TEAM:
+            print "similarity:", away_similar
+            return "AWAY", (hostname, hometeam)
+    
+    if TEAMNAMES_BATCH:
+        queue_teamnames(hostname, awayteam, hometeam, link)
+        raise UnresolvedTeamName("Can't tell which team is " + hostname + \
+                                 ": " + awayteam + " or " + hometeam + \
+                                 ". Queued in " + TEAMNAMES_QUEUE)
+    
+    selection = ask_teamnames(awayteam, hometeam)
+    if selection == 'A':
+        remember_teamname(hostname, awayteam)
+        return "AWAY", (hostname, hometeam)
+    elif selection == 'B':
+        remember_teamname(hostname, hometeam)
+        return "HOME", (hostname, awayteam)
+    else:
+        raise UserWarning("\n\nERROR MESSAGE: Something went wrong "\
+                          "determining", "home/away teams.\nCheck if "\
+                          "hostname argument was " \
+                          "entered correctly\nExiting...\n\n")
+
+
+'''
+Asks which of a boxscore's two teams is the host team
+
+Returns: 'A' (away), 'B' (home), or anything else for neither
+'''
+def ask_teamnames(awayteam, hometeam):
+    print ("\n\nThe boxscore page is using a different name than"
+           " the given hostname. Do either of these options look like "
+           "they could be for the host team?")
+    print "\nTeam A:", awayteam, "\nTeam B:", hometeam
+    return raw_input("\n'A' or 'B' or 'neither': ").upper()
+
+
+'''
+Adds a game resolve_teamnames couldn't settle to TEAMNAMES_QUEUE, once
+'''
+def queue_teamnames(hostname, awayteam, hometeam, link):
+    global _teamnames_queued
+    if _teamnames_queued is None:
+        _teamnames_queued = set(row[:3] for row in read_teamnames_queue())
+    key = (hostname, awayteam, hometeam)
+    if key in _teamnames_queued:
+        return
+    _teamnames_queued.add(key)
+    with open(TEAMNAMES_QUEUE, 'ab') as file:
+        csv.writer(file).writerow(list(key) + [link or ''])
+
+
+'''
+Rows of TEAMNAMES_QUEUE as (hostname, away, home, link) tuples
+'''
+def read_teamnames_queue():
+    try:
+        with open(TEAMNAMES_QUEUE, 'rb') as file:
+            return [tuple(row) for row in csv.reader(file) if len(row) >= 4]
+    except IOError:
+        return []
+
+
+'''
+Asks about every game in TEAMNAMES_QUEUE and remembers the answers, so the
+next run scrapes those games without stopping. Games answered 'neither' stay
+in the queue
+'''
+def resolve_queue():
+    left = []
+    for hostname, awayteam, hometeam, link in read_teamnames_queue():
+        print "\n", hostname, link
+        selection = ask_teamnames(awayteam, hometeam)
+        if selection == 'A':
+            remember_teamname(hostname, awayteam)
+        elif selection == 'B':
+            remember_teamname(hostname, hometeam)
+        else:
+            left.append((hostname, awayteam, hometeam, link))
+    
+    with open(TEAMNAMES_QUEUE, 'wb') as file:
+        csv.writer(file).writerows(left)
+    print "\n", len(left), "games left in", TEAMNAMES_QUEUE
+
+
 
 '''
 Args:
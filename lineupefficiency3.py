@@ -1,5 +1,3 @@
-import requests #***
-from bs4 import BeautifulSoup #***
 import copy
 import pandas as pd #for creating dataframe ***
 import numpy as np
@@ -27,6 +25,14 @@ START_TIME_W = "10:00"
 START_TIME_OT = "05:00"
 POSS_RATIO = 0.44
 
+#parts of a boxscore page the scraper reads (play by play, lineups, team
+#..names, date, linescore), see le2.parse_page
+BOXSCORE_REGIONS = [('div', 'class', 'stats-box'),
+                    ('td', 'class', 'time'),
+                    ('span', 'class', 'team-name'),
+                    ('div', 'class', 'head'),
+                    ('div', 'class', 'linescore')]
+
 '''
 Takes one game's boxscore page and scrapes "raw" play by play table
 
@@ -80,62 +86,58 @@ def get_pbp(soup, homeaway, mw):
         scores.append(score)
         
     #TEAM AND OPPONENT PLAY DETAILS
-    rows = table_soup.findAll("tr")
-    
-    delete = [] #THIS LIST ALSO STORES END OF PERIOD LOCATIONS
-    for n, row in enumerate(rows):
-        if len(row.findAll("td")) < 4:
-            delete.append(n)
-    for n in reversed(delete):
-        rows.pop(n)
-    
-    details = []
-    for row in rows:
-        details.append(row.find("span", {"class":"text"}).contents[0].\
-                       replace("  ", "").replace('..', '.').replace("\n", ""))
-    #for d in details: print d
-        
     '''
-    OK in order to figure out which team a detail is about, we're gonna loop
-    through all the details and look in the position of where the home team's
-    detail should be. If it matches, it belongs to the home team. If it doesn't,
-    then it's the away team's.
+    OK in order to figure out which team a detail is about, we're gonna look
+    in the position of where the home team's detail should be. If it matches,
+    it belongs to the home team. If it doesn't, then it's the away team's.
+    
+    Rows with fewer than 4 cells mark the end of a period. Those get recorded
+    in breaks as they go by, as (where the period ends in the lists above,
+    start time of the next period), and get spliced in at the end.
     '''
-    for n, row in enumerate(rows):
+    breaks = []
+    end_rows = [] #row numbers of the end of period rows so far
+    counted = 0 #how many of end_rows come before row number len(breaks)
+    periods_played = 0
+    for n, row in enumerate(table_soup.findAll("tr")):
         contents = row.find_all("td")
-        if contents[3].text.replace("  ", "").replace("\n", "") == details[n]:
+        if len(contents) < 4:
+            #figure out how many periods have been played so far
+            while counted < len(end_rows) and end_rows[counted] < len(breaks):
+                counted = counted + 1
+            periods_played = periods_played + counted + 1
+            end_rows.append(n)
+            
+            if periods_played <= OTcheck: breaks.append((n - len(breaks) + 1, \
+                                                         start_time))
+            else: breaks.append((n - len(breaks) + 1, START_TIME_OT))
+            continue
+        
+        detail = row.find("span", {"class":"text"}).contents[0].\
+                       replace("  ", "").replace('..', '.').replace("\n", "")
+        if contents[3].text.replace("  ", "").replace("\n", "") == detail:
             #print "yes. home."
-            home_details.append(details[n].upper())
+            home_details.append(detail.upper())
             away_details.append("")
         else:
             #print "away"
-            away_details.append(details[n].upper())
+            away_details.append(detail.upper())
             home_details.append("")
     
     #print len(home_details), len(away_details), len(scores), len(times)
     
     
     #ADD DATA FOR END AND START OF PERIODS
-    shift = 1
-    periods_played = 0
-    for n, rownum in enumerate(delete):
-        #figure out how many periods have been played so far
-        for m in delete:
-            if n>m: periods_played = periods_played + 1
-        
-        periods_played = periods_played+1
-        
-        #write start of period
-        if periods_played <= OTcheck: times.insert(rownum+shift, start_time)
-        else: times.insert(rownum+shift, START_TIME_OT)
-        times.insert(rownum+shift, "00:00")
-        scores.insert(rownum+shift, scores[rownum+shift-1])
-        scores.insert(rownum+shift, scores[rownum+shift-1])
-        home_details.insert(rownum+shift, "START OF PERIOD")
-        home_details.insert(rownum+shift, "END OF PERIOD")
-        away_details.insert(rownum+shift, "START OF PERIOD")
-        away_details.insert(rownum+shift, "END OF PERIOD")
-        shift = shift + 1
+    times = list(splice_periods(times, breaks, \
+                                lambda previous, start: ("00:00", start)))
+    scores = list(splice_periods(scores, breaks, \
+                                 lambda previous, start: (previous, previous)))
+    home_details = list(splice_periods(home_details, breaks, \
+                        lambda previous, start: ("END OF PERIOD", \
+                                                 "START OF PERIOD")))
+    away_details = list(splice_periods(away_details, breaks, \
+                        lambda previous, start: ("END OF PERIOD", \
+                                                 "START OF PERIOD")))
     
     #for n, s in enumerate(away_details[:-1]): print times[n], scores[n], s, \
         #home_details[n]
@@ -148,6 +150,35 @@ def get_pbp(soup, homeaway, mw):
         return None 
 
 
+'''
+Helper for get_pbp. Walks items once and yields them with an end of period
+row and a start of period row added before items[loc] for each (loc, start)
+in breaks (after the last item, if loc is past the end)
+
+Args:
+items - one of get_pbp's lists
+breaks - list of (loc, start), loc in increasing order
+rows - function (previous, start) -> (end_row, start_row), where previous is
+       the item right before the break
+
+Returns: generator
+'''
+def splice_periods(items, breaks, rows):
+    n = 0
+    previous = None
+    for loc, start in breaks:
+        while n < loc and n < len(items):
+            previous = items[n]
+            yield previous
+            n = n + 1
+        end_row, start_row = rows(previous, start)
+        yield end_row
+        yield start_row
+        previous = start_row
+    for item in items[n:]:
+        yield item
+
+
 '''
 Pulls team names
 
@@ -171,74 +202,24 @@ def get_team_names(soup):
 
 
 '''
-Driver that runs get_teamnames, gets user input if the team names don't match
-the given hostname, and finds homeaway and team names (in correct order)
+Driver that runs get_teamnames and works out homeaway and team names (in
+correct order), see le2.resolve_teamnames
 
 Args:
 soup
 hostname
+teamnames - (AWAY_NAME, HOME_NAME) if already known (StatCrew xml games)
+link - boxscore url
 
 Returns:
 (homeaway, teamnames)
 '''
-def run_teamnames(soup, hostname):
-    teamnames = get_team_names(soup)
+def run_teamnames(soup, hostname, teamnames=None, link=None):
+    if teamnames is None:
+        teamnames = get_team_names(soup)
     if not teamnames: #handle games not yet played
         return None, None
-    awayteam = teamnames[0].upper()
-    hometeam = teamnames[1].upper()
-    
-    homeaway = ""
-    if awayteam == hostname:
-        homeaway = "AWAY"
-        teamnames = (awayteam, hometeam)
-    elif hometeam == hostname:
-        homeaway = "HOME"
-        teamnames = (hometeam, awayteam)
-    else:
-        #handle msu vs michigan game hostname: michigan state
-        if hostname == awayteam.replace(' STATE', '').replace(' ST', '') or \
-           hostname == hometeam.replace(' STATE', '').replace(' ST', '') or \
-           hostname == hometeam + " STATE" or \
-           hostname == awayteam + " STATE" or \
-           hostname == hometeam + " ST" or \
-           hostname == awayteam + " ST":
-            pass
-        else:
-            print "running similar()..."
-            print awayteam, hometeam
-            home_similar = le2.similar(hostname, hometeam)
-            away_similar = le2.similar(hostname, awayteam)
-    
-            if home_similar > away_similar and home_similar > 0.7:
-                print "similarity:", home_similar
-                homeaway = "HOME"
-                teamnames = (hostname, awayteam)
-                return homeaway, teamnames
-            elif away_similar > home_similar and away_similar > 0.7:
-                print "similarity:", away_similar
-                homeaway = "AWAY"
-                teamnames = (hostname, hometeam)
-                return homeaway, teamnames
-
-        print ("\n\nThe boxscore page is using a different name than"
-               " the given hostname. Do either of these options look like "
-               "they could be for the host team?")
-        print "\nTeam A:", awayteam, "\nTeam B:", hometeam
-        selection = raw_input("\n'A' or 'B' or 'neither': ").upper()
-        if selection == 'A':
-            homeaway = "AWAY"
-            teamnames = (hostname, hometeam)
-        elif selection == 'B':
-            homeaway = "HOME"
-            teamnames = (hostname, awayteam)
-        else:
-            raise UserWarning("\n\nERROR MESSAGE: Something went wrong "\
-                              "determining", "home/away teams.\nCheck if "\
-                              "hostname argument was " \
-                              "entered correctly\nExiting...\n\n")
-    
-    return homeaway, teamnames
+    return le2.resolve_teamnames(hostname, teamnames, link)
 
 
 '''
@@ -396,6 +377,17 @@ def get_date(soup):
     return holder.find('h1').span.text
 
 
+'''
+Same as get_date, for a game read from its StatCrew xml, written the way the
+html header writes it so a team's rows all carry one date format
+'''
+def get_xml_date(game):
+    date = game['date']
+    if date is None:
+        return ''
+    return "%s %d, %d" % (date.strftime('%B'), date.day, date.year)
+
+
 '''
 Uses url path to determine whether the game played is a men's game or a
 women's game, regardless of whether its given a schedule url or an individual
@@ -523,39 +515,71 @@ def scrape_all(soup, schedule_url, hostname):
         print "All available data has been scraped alraedy, according to", \
               "TEAMNAME_DONE.txt" 
     
-    for l in links:
+    added = 0 #games appended to HOSTNAME_all_lineups.csv
+    pages = le2.download_games(links, 1)
+    for l, (game, content) in itertools.izip(links, pages):
         print "WORKING ON:", l
         
-        r = requests.get(l)
-        soup = BeautifulSoup(r.content, "html.parser")   
-        
-        homeaway, teamnames = run_teamnames(soup, hostname)
-        if not homeaway: #handle games not yet played
-            break
-        
-        mw = menwomen(soup)
-        
-        print hostname, teamnames, homeaway, mw
-        
         filename = hostname.replace(' ', '').lower()        
         arg = 1
         
-        starters = get_starters(soup, homeaway)
-        if not starters:
-            #print "\n\nERROR MESSAGE no starters found. Exiting.\n\n"
-            #sys.exit(1)
-            raise UserWarning("ERROR MESSAGE no starters found")
-        else:
-            pbp = get_pbp(soup, homeaway, mw)
+        if game:
+            #StatCrew xml feed
+            if le2.not_final(game['final'], l):
+                continue
+            try:
+                homeaway, teamnames = run_teamnames(None, hostname, \
+                                        le2.statcrew_team_names(game), l)
+            except le2.UnresolvedTeamName as e:
+                print e, "\n"
+                continue
+            print hostname, teamnames, homeaway, "(xml)"
+            
+            starters = le2.statcrew_starters(game, homeaway)
+            print "starters:", starters
+            pbp = le2.statcrew_pbp(game, homeaway)
             play_table = le2.copy_table(pbp, starters, arg)
-            le2.lineup_table(play_table, teamnames, filename, get_date(soup), arg)
+            le2.lineup_table(play_table, teamnames, filename, \
+                             get_xml_date(game), arg)
+            added = added + 1
+        else:
+            if le2.not_final(le2.page_is_final(content), l):
+                continue
+            soup = le2.parse_page(content, BOXSCORE_REGIONS)
+            
+            try:
+                homeaway, teamnames = run_teamnames(soup, hostname, link=l)
+            except le2.UnresolvedTeamName as e:
+                print e, "\n"
+                soup.decompose()
+                continue
+            if not homeaway: #handle games not yet played
+                break
+            
+            mw = menwomen(soup)
+            
+            print hostname, teamnames, homeaway, mw
+            
+            starters = get_starters(soup, homeaway)
+            if not starters:
+                #print "\n\nERROR MESSAGE no starters found. Exiting.\n\n"
+                #sys.exit(1)
+                raise UserWarning("ERROR MESSAGE no starters found")
+            else:
+                pbp = get_pbp(soup, homeaway, mw)
+                play_table = le2.copy_table(pbp, starters, arg)
+                le2.lineup_table(play_table, teamnames, filename, \
+                                 get_date(soup), arg)
+                added = added + 1
+            soup.decompose() #free the page before the next one gets parsed
         
         with open(filename + "DONE.txt",'a') as file:
             file.write(l + "\n")
 
         print "\n"
     
-    le2.dataframe(hostname)
+    if added or le2.REFRESH_UNCHANGED:
+        le2.dataframe(hostname)
     
     
 
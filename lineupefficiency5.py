@@ -1,9 +1,13 @@
-import requests
 from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.support.ui import Select
+from selenium.webdriver.support.ui import Select, WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
 import sys
 import time
+import itertools
+import re
+import collections
 
 import lineupefficiency2 as le2
 
@@ -25,6 +29,182 @@ A schedule and results page can:
 Author: Matt Wang
 '''
 
+#(url, tier) -> soup for boxscores in the current run, see run_page
+_run_pages = {}
+
+#css selectors a rendered boxscore needs, see le2.wait_until_ready
+BOXSCORE_READY = ['center h4'] #team names, on tag and text style pages
+
+#parts of a boxscore page the scraper reads, see le2.parse_page. These pages
+#..are found by counting <center> tags, so they stay on html.parser, which
+#..nests StatCrew's unclosed tags the way those counts were written against
+BOXSCORE_REGIONS = [('center', None, None),
+                    ('pre', None, None),
+                    ('span', 'class', 'presmall')]
+BOXSCORE_PARSER = 'html.parser'
+
+#(soup, page) for the last text-style boxscore read_text_page went through
+_text_page = (None, None)
+
+#where the play-by-play columns of a text-style boxscore start when no clock
+#..column can be found: home detail, time, score, visitor detail
+TEXT_PBP_COLUMNS = (0, 48, 54, 67)
+CLOCK = re.compile(r'\d\d:\d\d')
+TAG = re.compile(r'<[^>]*>')
+
+
+'''
+Per-run page cache for boxscores. A page is downloaded with plain http
+(tier 'http') or rendered in a browser (tier 'browser') at most once per run,
+and every helper asking for it after that gets the same soup back. Tag-style
+boxscores used to be rendered twice, once in get_team_names2 and again in
+get_starters2
+
+Args:
+url
+tier - 'http' or 'browser'
+
+Returns: BeautifulSoup object
+'''
+def run_page(url, tier):
+    key = (url, tier)
+    if key not in _run_pages:
+        if tier == 'browser':
+            _run_pages[key] = le2.get_site(url, BOXSCORE_READY, \
+                                    BOXSCORE_REGIONS, BOXSCORE_PARSER)
+        else:
+            _run_pages[key] = le2.parse_page(le2.fetch_url(url), \
+                                    BOXSCORE_REGIONS, BOXSCORE_PARSER)
+    return _run_pages[key]
+
+
+'''
+Drops a game's pages from the per-run page cache once the game is done and
+frees their trees
+'''
+def forget_run_page(url):
+    global _text_page
+    _text_page = (None, None)
+    for tier in ('http', 'browser'):
+        soup = _run_pages.pop((url, tier), None)
+        if soup is not None:
+            soup.decompose()
+
+
+'''
+Reads a text-style (plain <pre>) boxscore once and splits it into the pieces
+the text-style helpers want, so team names, date, starters and plays all come
+from the same pass over the text. The last page read is kept, so every helper
+called on the same soup gets it back for free.
+
+Returns: dict, or None if the page has no <pre> block
+header - unicode text above the VISITORS line (title, date, site)
+lines - unicode lines of the boxscore <pre>
+linked - True if player names in the boxscore link to their player pages
+teams - {'AWAY': line, 'HOME': line} team header lines, starting at
+        'VISITORS:' / 'HOME TEAM:'
+box - {'AWAY': rows, 'HOME': rows} lines under each 'BLK S MIN' stat header
+plays - ascii lines of the play-by-play block, None if the page has none
+periods - list of each period's play lines
+columns - (home, time, score, visitor) where each play column starts
+'''
+def read_text_page(soup):
+    global _text_page
+    if _text_page[0] is soup:
+        return _text_page[1]
+    
+    pre = soup.find('pre')
+    if pre is None:
+        _text_page = (soup, None)
+        return None
+    
+    text = pre.get_text()
+    lines = text.split('\n')
+    page = {'header': text[:text.find('VISITORS')], 'lines': lines, \
+            'linked': bool(pre.find_all('a')), 'teams': {}, 'box': {}}
+    
+    headers = []
+    for n, line in enumerate(lines):
+        for homeaway, tag in (('AWAY', 'VISITORS:'), ('HOME', 'HOME TEAM:')):
+            loc = line.find(tag)
+            if loc != -1 and homeaway not in page['teams']:
+                page['teams'][homeaway] = line[loc:].encode('ascii', 'ignore')
+        if 'BLK S MIN' in line:
+            headers.append(n)
+    for homeaway, n in zip(('AWAY', 'HOME'), headers):
+        page['box'][homeaway] = lines[n+1 : n+6]
+    
+    #play-by-play block
+    try:
+        plays = soup.find("span", {"class":"presmall"}).get_text()
+    except AttributeError:
+        try:
+            plays = soup.find_all("pre")[1].get_text()
+        except IndexError:
+            plays = None
+    if plays is None:
+        page['plays'] = None
+        page['periods'] = []
+        page['columns'] = TEXT_PBP_COLUMNS
+    else:
+        #only whole lines, between the first and last line break
+        rows = plays.encode('ascii', 'ignore').split('\n')[1:-1]
+        page['plays'] = rows
+        page['periods'] = text_periods(rows)
+        page['columns'] = text_columns(page['periods'])
+    
+    _text_page = (soup, page)
+    return page
+
+
+'''
+Helper for read_text_page. Splits the play-by-play lines into periods. Each
+period starts under a '----------' rule and runs to the first blank line, and
+the blank lines padding the gap before the next period are skipped
+'''
+def text_periods(rows):
+    start_locs = []
+    end_locs = []
+    for n, r in enumerate(rows):
+        if '----------' in r:
+            start_locs.append(n+1)
+            
+        if r == '\r' or not r: #there are no empty strings, only this \r tag
+            if end_locs:
+                #only want to add the first empty row, not all the other ones
+                #in the buffer space between period pbp data
+                if n > end_locs[len(end_locs)-1] + 10:
+                    if len(end_locs) < len(start_locs):
+                        end_locs.append(n)
+            else:
+                #don't add any rows too high up cause that just doesn't make
+                #..sense
+                if n > 10:
+                    end_locs.append(n)
+    
+    return [rows[start : end] for start, end in zip(start_locs, end_locs)]
+
+
+'''
+Helper for read_text_page. Works out where the play columns start from where
+the game clock (MM:SS) sits on most play lines. The score starts one column
+past the clock and the visitor detail 19 past it, like the standard layout.
+Falls back to TEXT_PBP_COLUMNS when no line has a clock
+'''
+def text_columns(periods):
+    starts = collections.Counter()
+    for period in periods:
+        for r in period:
+            match = CLOCK.search(r)
+            if match:
+                starts[match.start()] += 1
+    if not starts:
+        return TEXT_PBP_COLUMNS
+    
+    clock = starts.most_common(1)[0][0]
+    home, time, score, visitor = TEXT_PBP_COLUMNS
+    return (home, clock, clock + score - time, clock + visitor - time)
+
 
 '''
 Gets starting lineup from boxscore page. Used at start of copy_table()
@@ -47,10 +227,7 @@ def get_starters(soup, homeaway, url):
     
     if len(tables) < 4:
         #run helpers for text-style
-        holder = soup.find('pre')
-        names = holder.find_all('a')
-        
-        if names:
+        if read_text_page(soup)['linked']:
             (starters, soup) = get_starters1(soup,homeaway)
         else:
             (starters, soup) = get_starters3(soup,homeaway)
@@ -77,25 +254,11 @@ linked or not (GW Terry Nolan Jr. bug)
 #http://www.gwsports.com/sports/m-baskbl/stats/2017-2018/gm16uri.html
 def get_starters1(soup,homeaway):
     #print "get_starters1"
-    holder = soup.find('pre').text
-    
-    loc1 = holder.find('BLK S MIN')
-    loc2 = holder.find('BLK S MIN', loc1+1)
-    
-    #focus on correct text block
-    if homeaway == 'AWAY':
-        holder = holder[loc1:loc2]
-    elif homeaway == 'HOME':
-        holder = holder[loc2:]
-    
-    #break up rows and ignore stats row
-    loc = holder.find('\n')+1
-    holder = holder[loc:]
-    rows = holder.split('\n')
+    rows = read_text_page(soup)['box'].get(homeaway, [])
     
     #isolate name
     starters = []
-    for r in rows[:5]:
+    for r in rows:
         name = r[3:24].replace('.', '')
         name = le2.nice_name(name)
         starters.append(name)
@@ -116,7 +279,7 @@ def get_starters2(url, homeaway):
     #print "get_starters2"
 
     #initialize soup using webdriver 
-    soup = le2.get_site(url)
+    soup = run_page(url, 'browser')
     
     table_soup = soup.find_all("center")[2] #WILL IT ALWAYS BE THE 2nd index?
     
@@ -145,21 +308,13 @@ names
 #http://www.goseattleu.com/fls/18200/stats/mbasketball/2017-18/SUMBB17.HTM
 def get_starters3(soup, homeaway):
     #print "get_starters3"
-    holder = soup.find('pre').text.encode('ascii', 'ignore')
+    #whole lines only, nothing after the last line break
+    rows = [r.encode('ascii', 'ignore') for r in \
+            read_text_page(soup)['lines'][:-1]]
     
     if homeaway == "HOME": tag = "HOME TEAM"
     else: tag = "VISITORS"
     
-    newlines = []
-    for i in range(len(holder)):
-        if holder[i] == '\n':
-            newlines.append(i)
-    rows = []
-    prev = 0
-    for i in newlines:
-        rows.append(holder[prev:i+1].replace('\n', ''))
-        prev = i+1
-    
     start = -1
     for i, r in enumerate(rows):
         if tag in r:
@@ -222,8 +377,11 @@ Returns None if there is no play data or no sub data
 from lineupefficiency4
 '''
 def get_pbp1(soup,homeaway,mw):
+    page = read_text_page(soup)
+    
     #check for page with no sub data or no play data
-    if "SUB IN : " not in soup.text.upper():
+    if page is None or page['plays'] is None or \
+       not any("SUB IN : " in r.upper() for r in page['plays']):
         return None
     
     if mw == 'M':
@@ -245,81 +403,34 @@ def get_pbp1(soup,homeaway,mw):
     home_details.append("START OF PERIOD")
     away_details.append("START OF PERIOD")
     
-    try:
-        pbp = soup.find("span", {"class":"presmall"}).get_text().\
-                                                    encode('ascii', 'ignore')
-    except:
-        try:
-            pbp = soup.find_all("pre")[1].get_text().encode('ascii', 'ignore')
-        except:
-            return None
-    
-    #split up text mass into rows
-    spot = 0 #string index of last \n found
-    newlines = []
-    while spot < len(pbp)-1:
-        nextt = pbp.find('\n', spot)
-        spot = nextt+1
-        newlines.append(nextt)
-    
-    rows = []
-    for i in range(len(newlines)-1):
-        rows.append(pbp[newlines[i]+1:newlines[i+1]])
-    
-    start_locs = []
-    end_locs = []
-    #FIND START AND END LOCATIONS IN ROWS
-    for n, r in enumerate(rows):
-        #print r 
-        
-        if '----------' in r:
-            start_locs.append(n+1)
-            
-        if r == '\r' or not r: #there are no empty strings, only this \r tag
-            if end_locs:
-                #only want to add the first empty row, not all the other ones
-                #in the buffer space between period pbp data
-                if n > end_locs[len(end_locs)-1] + 10:
-                    #print start_locs
-                    #print end_locs
-                    if len(end_locs) < len(start_locs):
-                        end_locs.append(n)
-            else:
-                #don't add any rows too high up cause that just doesn't make
-                #..sense
-                if n > 10:
-                    end_locs.append(n)
-                
-    #print start_locs
-    #print end_locs
+    #where each column starts, 0/48/54/67 on the standard layout
+    home, clock, score, visitor = page['columns']
 
     periods_played = 0
-    for i in range(len(start_locs)):
-        segment = rows[ start_locs[i] : end_locs[i] ]
-        
+    for segment in page['periods']:
         for r in segment:
             #print r
             
-            #TIME - 48th index
-            times.append(r[48:48+5].encode('ascii', 'ignore'))
+            #TIME
+            times.append(r[clock:clock+5])
             
-            #SCORE - 56th index to first space after
-            score_now = r[54:r.find(' ', 56)]
+            #SCORE - up to the first space two columns in
+            score_now = r[score:r.find(' ', score+2)]
             score_now = score_now.replace(' ', '')
             if score_now:
                 if homeaway == "AWAY": score_now = le2.flip(score_now)
-                scores.append(score_now.encode('ascii', 'ignore'))
-                current_score = score_now.encode('ascii', 'ignore')
+                scores.append(score_now)
+                current_score = score_now
             else:
                 scores.append(current_score)
                 
             #HOME DETAIL
-            home_details.append(r[:48].replace('  ', '').\
-                            encode('ascii', 'ignore').upper().replace('\r', ''))
+            home_details.append(r[home:clock].replace('  ', '').upper().\
+                                replace('\r', ''))
             
-            #AWAY DETAIL - 67th index
-            away_details.append(r[67:].replace('  ', '').\
-                            encode('ascii', 'ignore').upper().replace('\r', ''))
+            #AWAY DETAIL
+            away_details.append(r[visitor:].replace('  ', '').upper().\
+                                replace('\r', ''))
         
         periods_played = periods_played + 1
         
@@ -479,66 +590,40 @@ From lineupefficiency4
 def get_team_names1(soup):
     #some game pages have no data
     #(http://www.uhcougars.com/sports/m-baskbl/stats/2017-2018/hou0211.html)
-    try:
-        holder = soup.find("pre").get_text().encode('ascii', 'ignore')
-    except:
+    page = read_text_page(soup)
+    if page is None or len(page['teams']) < 2:
         return None
-        
-    #AWAY NAME
-    away_loc = holder.find('VISITORS:')
-    holder = holder[away_loc:]
     
+    away = header_team(page['teams']['AWAY'], 10)
+    home = header_team(page['teams']['HOME'], 11)
+    
+    return away.upper(), home.upper()
+
+
+'''
+Helper for get_team_names1. Pulls the team name out of a team header line
+like 'VISITORS: #9 Notre Dame 14-6, 5-3 ACC', dropping the ranking mark and
+everything from the record or a '(' on
+
+Args:
+line - header line starting at 'VISITORS:' or 'HOME TEAM:'
+start - where the name starts, just past the tag
+'''
+def header_team(line, start):
     #remove rankings marks ('#9 Notre Dame')
-    mark2 = holder.find('\n')
-    mark = holder[:mark2].find('#')
+    mark = line.find('#')
     if mark != -1:
-        space = holder[mark:].find(' ')+1
-        holder = holder[:mark] + holder[mark+space:]
+        space = line[mark:].find(' ')+1
+        line = line[:mark] + line[mark+space:]
     
     #figure out where team name ends
-    num_loc = number_loc(holder)-1 
-    space_loc = holder.find('\r')
-    paren_loc = holder.find('(')-1 #cause trailing space
-    locs = [num_loc, space_loc, paren_loc]
-    
-    to_remove = []
-    for l in locs:
-        if l < 0:
-            to_remove.append(l)
-    for l in to_remove:
-        locs.remove(l)
-        
-    end_loc = min(locs)
-    away = holder[10 : end_loc]
-    
-    #HOME NAME
-    home_loc = holder.find('HOME TEAM:')
-    holder = holder[home_loc:]
-    
-    #remove rankings marks ('#9 Notre Dame')
-    mark2 = holder.find('\n')
-    mark = holder[:mark2].find('#')
-    if mark != -1:
-        space = holder[mark:].find(' ')+1
-        holder = holder[:mark] + holder[mark+space:]
-    
-    num_loc = number_loc(holder)-1
-    space_loc = holder.find('\r')
-    paren_loc = holder.find('(')-1
-    locs = [num_loc, space_loc, paren_loc]
-    
-    to_remove = []
-    for l in locs:
-        if l < 0:
-            to_remove.append(l)
-    for l in to_remove:
-        locs.remove(l)
-        
-    end_loc = min(locs)
-    home = holder[11:end_loc]
+    num_loc = number_loc(line)
+    if num_loc is not None:
+        num_loc = num_loc-1
+    locs = [num_loc, line.find('\r'), line.find('(')-1, len(line)]
+    end_loc = min(l for l in locs if l is not None and l >= 0)
     
-    return away.upper().encode('ascii', 'ignore'), \
-           home.upper().encode('ascii', 'ignore')
+    return line[start : end_loc]
 
 
 '''
@@ -559,7 +644,7 @@ link player names
 from lineupefficiency4b
 '''
 def get_team_names2(soup, url):
-    soup = le2.get_site(url)
+    soup = run_page(url, 'browser')
     
     table = soup.find_all("center")[2] #WILL IT ALWAYS BE THE 2nd index?
     holders = table.find_all('h4')
@@ -585,10 +670,9 @@ def get_date(soup):
         
     if len(tables) < 4:
         #if text style
-        holder = soup.find('pre').get_text()
+        holder = read_text_page(soup)['header']
 
         #remove rankings marks to use isdigit() ('#9 Notre Dame')
-        holder = holder[:holder.find('VISITORS')]
         mark = holder.find('#')
         if mark != -1:
             space = holder[mark:].find(' ')+1
@@ -612,12 +696,27 @@ def get_date(soup):
     return date.replace('-', '/').encode('ascii','ignore')
 
 
+'''
+Same as get_date, for a game read from its StatCrew xml, written the way the
+html header writes it (ex: 1/5/2018) so a team's rows all carry one date
+format
+'''
+def get_xml_date(game):
+    date = game['date']
+    if date is None:
+        return ''
+    return "%d/%d/%d" % (date.month, date.day, date.year)
+
+
 '''
 Returns True is pbp data exists on page
 False if it does not exist
+
+Takes the raw page, not the soup: the section headers it looks for can be
+outside the BOXSCORE_REGIONS the soup was built from
 '''
-def pbp_check(soup):
-    if 'Play-by-Play' in soup.text:
+def pbp_check(page):
+    if 'Play-by-Play' in page_text(page):
         return True
     else:
         print "Box score page has no play-by-play data."
@@ -627,17 +726,27 @@ def pbp_check(soup):
 '''
 Determines whether the game was played with 2 halves or 4 quarters.
 
+Takes the raw page, same as pbp_check
+
 Returns:
 'M' - 2 halves
 'W' - 4 quarters (women's games and NIT games)
 '''
-def menwomen(soup):
-    if "4th PERIOD" in soup.text:
+def menwomen(page):
+    if "4th PERIOD" in page_text(page):
         return "W"
     else:
         return "M"
 
 
+'''
+Helper for pbp_check and menwomen. The text of a whole page with its tags
+taken out, without building a soup for it
+'''
+def page_text(page):
+    return TAG.sub('', page).replace('&nbsp;', ' ')
+
+
 '''
 Returns list links to all boxscores on a team's schedule page
 
@@ -647,11 +756,7 @@ sch_url - link to schedule page
 year - int - year of season.  2017-2018 season translates to code of 2017
 '''
 def get_boxscores(soup, sch_url, year, filename):
-    try:
-        with open(filename+"DONE.txt",'r') as file:
-            read_already = file.read().splitlines()
-    except:
-        read_already = []
+    read_already = le2.been_read(filename)
         
     print "read already:", len(read_already), read_already
     
@@ -731,13 +836,36 @@ def get_boxscores1(soup,year,sch_url,read_already):
         info_pages.append(base.replace('xxgameidxx', i).replace('xxyearxx', \
                                     str(year)).replace('xxschoolcodexx', code))
         
+    urls = resolve_info_pages(info_pages, base2, read_already)
+    
+    print "urls length:", len(urls)
+    for url in urls: print url
+    return urls
+
+
+'''
+Helper for get_boxscores1
+Downloads every CBSi interstitial event xml page at once (up to
+le2.HOST_CONNECTIONS at a time, each with le2.FETCH_TIMEOUT) and pulls the
+boxscore links out of them. Pages that fail to download are skipped.
+
+Args:
+info_pages - list of grfx.cstv.com event xml urls, in schedule order
+base2 - base of url to add boxscore extension to
+read_already - list of urls read already
+
+Returns:
+urls - boxscore links in schedule order
+'''
+def resolve_info_pages(info_pages, base2, read_already):
+    pages = le2.download_all(info_pages, fetch_info_page, \
+                             le2.HOST_CONNECTIONS)
+    
     urls = []
-    for link in info_pages:
-        try:
-            r = requests.get(link)
-            soup2 = BeautifulSoup(r.content, "html.parser")
-        except:
+    for content in pages:
+        if content is None:
             continue
+        soup2 = BeautifulSoup(content, "html.parser")
         
         holder = soup2.find('related')
         if holder:
@@ -749,12 +877,20 @@ def get_boxscores1(soup,year,sch_url,read_already):
                     to_add = (base2 + h.get('url')).encode('ascii', 'ignore')
                     if to_add not in read_already:
                         urls.append(to_add.encode('ascii', 'ignore'))
-    
-    print "urls length:", len(urls)
-    for url in urls: print url
     return urls
 
 
+'''
+Helper for resolve_info_pages. Returns None instead of raising so one missing
+event page doesn't stop the rest
+'''
+def fetch_info_page(link):
+    try:
+        return le2.fetch_url(link)
+    except:
+        return None
+
+
 '''
 Helper for get_boxscores1
 Use Selenium library to open schedule webpage and select dropdown menu for
@@ -767,22 +903,51 @@ years_str - ex: 2017-2018 - needed to find dropdown selection
 Returns: a BeautifulSoup object for the proper year's schedule
 '''
 def get_correct_site(url, years_str):
-    print "running webdriver..."
-    
-    browser = webdriver.Firefox() 
-    browser.get(url)
+    key = 'render:' + url + '#' + years_str
+    html = le2.archived_page(key)
+    if html is not None:
+        return BeautifulSoup(html.decode('utf-8'), "html.parser")
+    cached = le2.cache_entry(key)
+    if cached and le2.cache_is_fresh(cached, le2.cache_ttl(url)):
+        html = le2.cache_read(cached)
+        le2.archive_page(key, html)
+        return BeautifulSoup(html.decode('utf-8'), "html.parser")
     
-    select = Select(browser.find_element_by_id('Q_SEASON'))
-    time.sleep(0.5)
+    print "running webdriver..."
+
+    entry = le2.checkout_browser()
+    browser = entry[0]
     try:
-        select.select_by_visible_text(years_str)
+        le2.throttle(url)
+        browser.get(url)
+        le2.wait_until_ready(browser, ['#Q_SEASON'])
+
+        select = Select(browser.find_element_by_id('Q_SEASON'))
+        try:
+            select.select_by_visible_text(years_str)
+        except:
+            browser.execute_script("window.scrollTo(0, 200)")
+            WebDriverWait(browser, le2.READY_TIMEOUT).until(
+                EC.element_to_be_clickable((By.ID, 'Q_SEASON')))
+            select.select_by_visible_text(years_str)
+
+        #picking a season reloads the schedule, wait for its header to match
+        try:
+            WebDriverWait(browser, le2.READY_TIMEOUT, poll_frequency=0.05).until(
+                EC.text_to_be_present_in_element(
+                    (By.CSS_SELECTOR, 'div.schedborder div'), years_str))
+        except TimeoutException:
+            print "schedule never showed", years_str
+
+        html = browser.page_source
     except:
-        browser.execute_script("window.scrollTo(0, 200)")
-        time.sleep(1)
-        select.select_by_visible_text(years_str)
-    
-    return_soup = BeautifulSoup(browser.page_source, "html.parser")
-    browser.close()
+        le2.checkin_browser(entry, crashed=True)
+        raise
+    le2.checkin_browser(entry)
+    le2.cache_write(key, html.encode('utf-8'))
+    le2.archive_page(key, html.encode('utf-8'))
+
+    return_soup = BeautifulSoup(html, "html.parser")
     return return_soup
 
 
@@ -808,72 +973,20 @@ def get_boxscores2(soup,sch_url,read_already):
 
 
 '''
-Driver that runs get_teamnames, gets user input if the team names don't match
-the given hostname, and finds homeaway and team names (in correct order)
+Driver that runs get_teamnames and works out homeaway and team names (in
+correct order), see le2.resolve_teamnames
 
 Args:
 soup
 hostname
 teamnames
+link - boxscore url
 
 Returns:
 (homeaway, teamnames)
 '''
-def run_teamnames(soup, hostname, teamnames):
-    awayteam = teamnames[0].upper()
-    hometeam = teamnames[1].upper()
-    
-    homeaway = ""
-    if awayteam == hostname:
-        homeaway = "AWAY"
-        teamnames = (awayteam, hometeam)
-    elif hometeam == hostname:
-        homeaway = "HOME"
-        teamnames = (hometeam, awayteam)
-    else:
-        #handle msu vs michigan game hostname: michigan state
-        if hostname == awayteam.replace(' STATE', '').replace(' ST', '') or \
-           hostname == hometeam.replace(' STATE', '').replace(' ST', '') or \
-           hostname == hometeam + " STATE" or \
-           hostname == awayteam + " STATE" or \
-           hostname == hometeam + " ST" or \
-           hostname == awayteam + " ST":
-            pass
-        else:
-            print "running similar()..."
-            print awayteam, hometeam
-            home_similar = le2.similar(hostname, hometeam)
-            away_similar = le2.similar(hostname, awayteam)
-    
-            if home_similar > away_similar and home_similar > 0.7:
-                print "similarity:", home_similar
-                homeaway = "HOME"
-                teamnames = (hostname, awayteam)
-                return homeaway, teamnames
-            elif away_similar > home_similar and away_similar > 0.7:
-                print "similarity:", away_similar
-                homeaway = "AWAY"
-                teamnames = (hostname, hometeam)
-                return homeaway, teamnames
-
-        print ("\n\nThe boxscore page is using a different name than"
-               " the given hostname. Do either of these options look like "
-               "they could be for the host team?")
-        print "\nTeam A:", awayteam, "\nTeam B:", hometeam
-        selection = raw_input("\n'A' or 'B' or 'neither': ").upper()
-        if selection == 'A':
-            homeaway = "AWAY"
-            teamnames = (hostname, hometeam)
-        elif selection == 'B':
-            homeaway = "HOME"
-            teamnames = (hostname, awayteam)
-        else:
-            raise UserWarning("\n\nERROR MESSAGE: Something went wrong "\
-                              "determining", "home/away teams.\nCheck if "\
-                              "hostname argument was " \
-                              "entered correctly\nExiting...\n\n")
-    
-    return homeaway, teamnames
+def run_teamnames(soup, hostname, teamnames, link=None):
+    return le2.resolve_teamnames(hostname, teamnames, link)
 
 
 '''
@@ -893,39 +1006,74 @@ def run(soup, hostname, sch_url, year):
     
     print
     no_data = 0
-    for l in links:
+    added = 0 #games appended to HOSTNAME_all_lineups.csv
+    _run_pages.clear()
+    pages = le2.download_games(links, 2)
+    for l, (game, content) in itertools.izip(links, pages):
         print "\n\nworking on:", l
         
-        r = requests.get(l)
-        soup = BeautifulSoup(r.content, "html.parser")
-        
-        teamnames = get_team_names(soup, l)
-        if teamnames == None:
-            no_data = no_data + 1
-        else:
-            homeaway, teamnames = run_teamnames(soup, hostname, teamnames)
-            
-            mw = menwomen(soup)
-            
-            print hostname, teamnames, homeaway, mw
+        arg = 2
+        if game:
+            #StatCrew xml feed
+            if le2.not_final(game['final'], l):
+                continue
+            try:
+                homeaway, teamnames = run_teamnames(None, hostname, \
+                                        le2.statcrew_team_names(game), l)
+            except le2.UnresolvedTeamName as e:
+                print e, "\n"
+                continue
+            print hostname, teamnames, homeaway, "(xml)"
             
-            (starters, soup) = get_starters(soup, homeaway, l)
+            starters = le2.statcrew_starters(game, homeaway)
+            print "starters:", starters
+            pbp = le2.statcrew_pbp(game, homeaway)
+            play_table = le2.copy_table(pbp, starters, arg)
+            le2.lineup_table(play_table, teamnames, filename, \
+                             get_xml_date(game), arg)
+            added = added + 1
+        else:
+            if le2.not_final(le2.page_is_final(content), l):
+                continue
+            soup = le2.parse_page(content, BOXSCORE_REGIONS, BOXSCORE_PARSER)
+            _run_pages[(l, 'http')] = soup
             
-            arg = 2
-            pbp = get_pbp(soup, homeaway, mw)
-            if pbp == None:
-                print "No pbp data for this game\n\n"
+            teamnames = get_team_names(soup, l)
+            if teamnames == None:
                 no_data = no_data + 1
             else:
-                play_table = le2.copy_table(pbp, starters, arg)
-                le2.lineup_table(play_table, teamnames, filename, get_date(soup), arg)
+                try:
+                    homeaway, teamnames = run_teamnames(soup, hostname, \
+                                                        teamnames, l)
+                except le2.UnresolvedTeamName as e:
+                    print e, "\n"
+                    forget_run_page(l)
+                    continue
+                
+                mw = menwomen(content)
+                
+                print hostname, teamnames, homeaway, mw
+                
+                (starters, soup) = get_starters(soup, homeaway, l)
+                
+                pbp = get_pbp(soup, homeaway, mw)
+                if pbp == None:
+                    print "No pbp data for this game\n\n"
+                    no_data = no_data + 1
+                else:
+                    play_table = le2.copy_table(pbp, starters, arg)
+                    le2.lineup_table(play_table, teamnames, filename, \
+                                     get_date(soup), arg)
+                    added = added + 1
 
         
         #ADD GAME URL TO READ_ALREADY FILE
         with open(filename+"DONE.txt",'a') as file:
             file.write(l + "\n")
+        forget_run_page(l)
         
-    le2.dataframe(hostname)
+    if added or le2.REFRESH_UNCHANGED:
+        le2.dataframe(hostname)
     print "\nGames without data:", no_data
     
 
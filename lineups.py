@@ -1,9 +1,18 @@
 import time
 import sys
+import os
+import argparse
+import multiprocessing #for running teams in parallel
+import traceback
 import lineupefficiency2 as le2
 import lineupefficiency3 as le3
 import lineupefficiency5 as le5
 
+#le2 settings a worker process copies from the process that started it, see
+#..run_group
+WORKER_SETTINGS = ['REFRESH_UNCHANGED', 'FINAL_ONLY', 'SCHEDULE_TTL', \
+                   'LIVE_BOXSCORE_TTL']
+
 
 '''
 Driver for the lineup efficiency tool
@@ -20,7 +29,25 @@ hostname
 year - for le5 helper only
 '''
 def run(sch_url, hostname, year):
-    soup = le2.get_site(sch_url)
+    le2.open_archive(hostname, sch_url, year)
+    le2.load_aliases(hostname)
+    le2.reset_roster()
+    try:
+        scrape(sch_url, hostname, year)
+    finally:
+        le2.close_archive()
+    names = le2.name_cache_info()
+    print "Names: %d cached, %d%% of lookups saved" % \
+          (names['size'], 100*names['hit_rate'])
+
+
+'''
+Helper for run that reads the schedule page and hands it to the right
+provider's scraper
+'''
+def scrape(sch_url, hostname, year):
+    soup = le2.get_page(sch_url, le2.SCHEDULE_MARKERS, any, \
+                        signatures=le2.PRESTO_SCHEDULE_SIGNATURES)
     text = soup.text.upper()
     if 'SIDEARM' in text:
         print "\nSIDEARM SPORTS\n"
@@ -47,7 +74,13 @@ def run(sch_url, hostname, year):
         
         le3.main(soup, sch_url, hostname) 
     
-def main():
+'''
+Reads todo.txt and turns each line into the arguments for run
+
+Returns:
+jobs - list of (sch_url, hostname, year)
+'''
+def read_todo():
     #read file with info on which teams to analyze
     filename = 'todo.txt'
     try:
@@ -62,6 +95,7 @@ def main():
     #TEST
     #todo = ["2017 http://www.pepperdinewaves.com/sports/m-baskbl/sched/pepp-m-baskbl-sched.html pepperdine"] #111
     
+    jobs = []
     for line in todo:
         #check if 'arg1' is a year (le5 format)...
         year = -1 #arg for if we run le5.main
@@ -75,7 +109,30 @@ def main():
             raise UserWarning("ERROR with argument lines in todo.txt")
         sch_url = line[:loc]
         hostname = line[loc+1:].upper()
-        
+        jobs.append((sch_url, hostname, year))
+    return jobs
+
+
+'''
+Args:
+archive - None, 'record' to save every page fetched to each team-season's
+          HOSTNAME_SEASON_pages.zip, or 'replay' to rerun from those archives
+          without touching the network
+workers - number of teams to scrape at once, each in its own process
+batch - True to queue games whose team names can't be matched to the
+        hostname instead of asking (see le2.resolve_teamnames). Always on
+        with more than one worker
+'''
+def main(archive=None, workers=1, batch=False):
+    le2.ARCHIVE_MODE = archive
+    le2.TEAMNAMES_BATCH = batch
+
+    jobs = read_todo()
+    if workers > 1:
+        run_parallel(jobs, workers, archive)
+        return
+    
+    for sch_url, hostname, year in jobs:
         print
         print hostname
         print sch_url
@@ -87,13 +144,183 @@ def main():
             #with open('error.txt','a') as file:
                 #file.write('Error with ' + hostname + ': ' + str(e) + '\n')
         run(sch_url, hostname, year) #111
+
+
+'''
+Parallel driver for main. Teams are independent, so each one runs in its own
+worker process. Every output file (HOSTNAME_all_lineups.csv, HOSTNAMEDONE.txt,
+HOSTNAMEn.csv, HOSTNAME_SEASON_pages.zip) is named after the hostname, so
+todo.txt lines that share a hostname (ex: two seasons of the same team) are run one
+after the other in the same worker and never write the same file at once.
+Workers share one set of per-host rate limits (see le2.share_throttle), so
+running more of them doesn't hit a host they have in common any harder.
+A team that crashes doesn't stop the others; a summary of successes and
+failures is printed at the end.
+
+Args:
+jobs - from read_todo
+workers - number of worker processes
+archive - see main
+'''
+def run_parallel(jobs, workers, archive):
+    groups = []
+    group_of = {}
+    for job in jobs:
+        filename = job[1].replace(' ', '').lower()
+        if filename not in group_of:
+            group_of[filename] = len(groups)
+            groups.append([])
+        groups[group_of[filename]].append(job)
+    
+    #one fresh process per team so browsers/sessions/caches aren't shared,
+    #..except the per-host rate limits, which cover every worker together
+    manager = multiprocessing.Manager()
+    pool = multiprocessing.Pool(workers, maxtasksperchild=1, \
+                                initializer=le2.share_throttle, \
+                                initargs=(manager.dict(), manager.Lock()))
+    try:
+        settings = dict((name, getattr(le2, name)) for name in WORKER_SETTINGS)
+        results = pool.map(run_group, [(g, archive, settings) \
+                                       for g in groups], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        manager.shutdown()
+    
+    successes = []
+    failures = []
+    for group in results:
+        for hostname, year, error in group:
+            if error:
+                failures.append((hostname, year, error))
+            else:
+                successes.append((hostname, year))
+    
+    print "\n\nSUMMARY:", len(successes), "succeeded,", len(failures), "failed"
+    for hostname, year in successes:
+        print "OK    ", hostname, "year:", year
+    for hostname, year, error in failures:
+        print "FAILED", hostname, "year:", year
+        print error
+
+
+'''
+Worker for run_parallel. Runs every todo.txt line for one hostname in order
+
+Args:
+args - (jobs, archive, settings) where settings maps each of
+       WORKER_SETTINGS to its value
+
+Returns:
+list of (hostname, year, error) where error is None or the traceback
+'''
+def run_group(args):
+    jobs, archive, settings = args
+    le2.ARCHIVE_MODE = archive
+    for name, value in settings.items():
+        setattr(le2, name, value)
+    le2.TEAMNAMES_BATCH = True #workers have no terminal to ask on
+    results = []
+    try:
+        for sch_url, hostname, year in jobs:
+            print "\n", hostname, sch_url, "year:", year
+            try:
+                run(sch_url, hostname, year)
+                results.append((hostname, year, None))
+            except Exception:
+                results.append((hostname, year, traceback.format_exc()))
+    finally:
+        #pool workers skip atexit, so shut this process's browsers down here
+        le2.close_browsers()
+    return results
+
+
+'''
+Watch mode for game nights. Keeps polling every team in todo.txt, every
+minutes minutes, until it's stopped with ctrl-c. Each poll rereads todo.txt
+and runs each team like main does, so only games missing from the team's
+HOSTNAMEDONE.txt get scraped. A team's aggregates (HOSTNAME_all_lineups.csv)
+are only rebuilt when it had new games. Teams whose DONE file changed most
+recently (the ones that played most recently) go first. A team that crashes
+is reported and tried again on the next poll. Unknown team names are always
+queued instead of asked about (see le2.resolve_teamnames).
+
+Args:
+minutes - time between the starts of two polls
+archive, workers - see main
+'''
+def watch(minutes, archive=None, workers=1):
+    le2.ARCHIVE_MODE = archive
+    le2.REFRESH_UNCHANGED = False
+    le2.TEAMNAMES_BATCH = True
+    le2.FINAL_ONLY = True
+    le2.SCHEDULE_TTL = min(le2.SCHEDULE_TTL, minutes*30)
+    le2.LIVE_BOXSCORE_TTL = min(le2.LIVE_BOXSCORE_TTL, minutes*30)
+    
+    while True:
+        started = time.time()
+        jobs = sorted(read_todo(), key=last_played, reverse=True)
+        print "\n\nPOLLING", len(jobs), "teams at", time.strftime('%H:%M:%S')
         
+        if workers > 1:
+            run_parallel(jobs, workers, archive)
+        else:
+            for sch_url, hostname, year in jobs:
+                print "\n", hostname, sch_url, "year:", year
+                try:
+                    run(sch_url, hostname, year)
+                except Exception:
+                    print "FAILED", hostname, "year:", year
+                    traceback.print_exc()
+        
+        wait = minutes*60 - (time.time() - started)
+        if wait > 0:
+            print "\nnext poll in %d seconds" % wait
+            time.sleep(wait)
+
+
+'''
+Sort key for watch: when the team's DONE file was last written, or 0 for a
+team that hasn't been scraped yet
+'''
+def last_played(job):
+    done = job[1].replace(' ', '').lower() + "DONE.txt"
+    try:
+        return os.path.getmtime(done)
+    except OSError:
+        return 0
+    
     
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Lineup efficiency tool")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--record', dest='archive', action='store_const', \
+                      const='record', help="save every page fetched to "\
+                      "HOSTNAME_SEASON_pages.zip")
+    mode.add_argument('--replay', dest='archive', action='store_const', \
+                      const='replay', help="rerun from "\
+                      "HOSTNAME_SEASON_pages.zip with no network")
+    parser.add_argument('-j', '--workers', type=int, default=1, \
+                        help="number of teams to scrape at once")
+    parser.add_argument('--watch', type=float, metavar='MINUTES', \
+                        help="keep polling every team's schedule for new "\
+                        "games every MINUTES minutes")
+    parser.add_argument('--batch', action='store_true', help="queue games "\
+                        "with unrecognized team names in "\
+                        "teamnames_queue.csv instead of asking")
+    parser.add_argument('--resolve', action='store_true', help="answer the "\
+                        "team name questions queued by --batch and exit")
+    args = parser.parse_args()
+    
     print "*starting...*"
     
     start_time = time.time()
     
-    main()
+    if args.resolve:
+        le2.resolve_queue()
+    elif args.watch:
+        watch(args.watch, args.archive, args.workers)
+    else:
+        main(args.archive, args.workers, args.batch)
 
     print "\n*done* --- %s seconds ---" % (time.time() - start_time)
\ No newline at end of file